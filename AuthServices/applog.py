@@ -0,0 +1,79 @@
+# structured, non-blocking logging
+#
+# records are handed to a QueueHandler and written as one json object per
+# line by a background QueueListener, so a slow stdout never stalls the
+# event loop. every record carries the current request id.
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+request_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        # anything passed through extra={...}
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: logging.Handler | None = None
+
+def setup_logging():
+    global _listener, _handler
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    _handler = logging.handlers.QueueHandler(records)
+    # the filter runs in the caller's context, where the request id is set
+    _handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger("auth")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_handler)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    global _listener, _handler
+    if _listener is not None:
+        root = logging.getLogger("auth")
+        root.removeHandler(_handler)
+        root.propagate = True
+        _listener.stop()
+        _listener = None
+        _handler = None
+
+def get_logger(name: str):
+    return logging.getLogger(f"auth.{name}")
@@ -0,0 +1,179 @@
+# audit trail for logins and user administration
+#
+# record() only appends to an in-memory buffer; a background task writes the
+# buffer out in batches of AUDIT_BATCH_SIZE, or every AUDIT_FLUSH_SECONDS,
+# so a login never waits on an audit INSERT. AUDIT_SINK picks where batches
+# go:
+#   db    one executemany per batch into the append-only auditLog table
+#         (migrations/<backend>/0004_audit_log.sql); queryable via /audit
+#   file  json lines appended to AUDIT_FILE, rotated at AUDIT_FILE_MAX_BYTES
+#         keeping AUDIT_FILE_BACKUPS old files; meant for a single process
+# the buffer holds at most AUDIT_MAX_BUFFER events. when it is full,
+# AUDIT_OVERFLOW=drop_oldest discards the oldest buffered event and
+# drop_newest discards the incoming one; either way audit_dropped counts it.
+# a failed write keeps the batch buffered (space permitting) for the next
+# flush, and stop() flushes whatever is left on shutdown.
+import asyncio
+import collections
+import json
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+import applog
+import metrics
+from database import get_db_connection, transaction
+
+load_dotenv()
+
+logger = applog.get_logger("audit")
+
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "true").lower() in ("1", "true", "yes")
+AUDIT_SINK = os.getenv("AUDIT_SINK", "db")  # db | file
+AUDIT_FILE = os.getenv("AUDIT_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit", "audit.log"))
+AUDIT_FILE_MAX_BYTES = int(os.getenv("AUDIT_FILE_MAX_BYTES", 10 * 1024 * 1024))
+AUDIT_FILE_BACKUPS = int(os.getenv("AUDIT_FILE_BACKUPS", 5))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 200))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", 1))
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", 10000))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop_oldest")  # drop_oldest | drop_newest
+
+COLUMNS = ('OccurredAt', 'Action', 'Outcome', 'Actor', 'Target', 'System', 'ClientIP', 'RequestID', 'Detail')
+
+_buffer: collections.deque = collections.deque()
+_wakeup: asyncio.Event | None = None
+_flusher: asyncio.Task | None = None
+_stopping = False
+
+
+def _drop(reason: str):
+    metrics.incr('audit_dropped', labels={"reason": reason})
+
+# queue one event; never blocks and never raises
+def record(action: str, outcome: str = "success", actor: str | None = None, target: str | None = None,
+           system: str | None = None, client_ip: str | None = None, **detail):
+    if not AUDIT_ENABLED:
+        return
+    event = (
+        datetime.utcnow(), action, outcome, actor, target, system, client_ip,
+        applog.request_id_var.get(), json.dumps(detail, default=str) if detail else None,
+    )
+    if len(_buffer) >= AUDIT_MAX_BUFFER:
+        if AUDIT_OVERFLOW == "drop_newest":
+            _drop("overflow")
+            return
+        _buffer.popleft()
+        _drop("overflow")
+    _buffer.append(event)
+    metrics.incr('audit_events', labels={"action": action, "outcome": outcome})
+    if _wakeup is not None and len(_buffer) >= AUDIT_BATCH_SIZE:
+        _wakeup.set()
+
+def buffered():
+    return len(_buffer)
+
+metrics.register_collector(lambda: [('audit_buffer_size', buffered(), None)])
+
+async def _write_db(batch):
+    conn = await get_db_connection()
+    try:
+        async with transaction(conn) as cursor:
+            await cursor.executemany(
+                f"INSERT INTO auditLog ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                batch
+            )
+    finally:
+        await conn.close()
+
+def _rotate():
+    for i in range(AUDIT_FILE_BACKUPS - 1, 0, -1):
+        older = f"{AUDIT_FILE}.{i}"
+        if os.path.exists(older):
+            os.replace(older, f"{AUDIT_FILE}.{i + 1}")
+    if AUDIT_FILE_BACKUPS > 0:
+        os.replace(AUDIT_FILE, f"{AUDIT_FILE}.1")
+    else:
+        os.remove(AUDIT_FILE)
+
+def _write_file(batch):
+    os.makedirs(os.path.dirname(AUDIT_FILE), exist_ok=True)
+    data = "".join(
+        json.dumps({name: value for name, value in zip(COLUMNS, event)}, default=str) + "\n"
+        for event in batch
+    ).encode("utf-8")
+    if os.path.exists(AUDIT_FILE) and os.path.getsize(AUDIT_FILE) + len(data) > AUDIT_FILE_MAX_BYTES:
+        _rotate()
+    # one write per batch, appended
+    fd = os.open(AUDIT_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+# write out up to one batch; False if the write failed
+async def flush_once():
+    if not _buffer:
+        return True
+    batch = [_buffer.popleft() for _ in range(min(AUDIT_BATCH_SIZE, len(_buffer)))]
+    started = time.perf_counter()
+    try:
+        if AUDIT_SINK == "file":
+            await asyncio.to_thread(_write_file, batch)
+        else:
+            await _write_db(batch)
+    except Exception:
+        logger.exception("Error writing audit events", extra={"events": len(batch)})
+        metrics.incr('audit_flush_errors')
+        # back to the front, in order, as far as there is room
+        room = AUDIT_MAX_BUFFER - len(_buffer)
+        if room < len(batch):
+            metrics.incr('audit_dropped', len(batch) - room, labels={"reason": "write_failed"})
+            batch = batch[:room]
+        _buffer.extendleft(reversed(batch))
+        return False
+    metrics.observe('audit_flush', time.perf_counter() - started)
+    metrics.incr('audit_written', len(batch))
+    return True
+
+async def flush():
+    while _buffer:
+        if not await flush_once():
+            return False
+    return True
+
+async def _wait(seconds: float):
+    try:
+        await asyncio.wait_for(_wakeup.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+    _wakeup.clear()
+
+async def _flush_forever():
+    while not _stopping:
+        await _wait(AUDIT_FLUSH_SECONDS)
+        if not await flush() and not _stopping:
+            # sink unavailable; give it a full interval before retrying
+            await asyncio.sleep(AUDIT_FLUSH_SECONDS)
+
+def start():
+    global _wakeup, _flusher, _stopping
+    if _flusher is not None and not _flusher.done():
+        return
+    _stopping = False
+    _wakeup = asyncio.Event()
+    _flusher = asyncio.create_task(_flush_forever())
+
+# stop the flusher and write out what is still buffered. the flusher is
+# woken rather than cancelled, so a batch is never abandoned mid-write
+async def stop():
+    global _flusher, _wakeup, _stopping
+    if _flusher is not None:
+        _stopping = True
+        _wakeup.set()
+        await _flusher
+        _flusher = None
+    _wakeup = None
+    if _buffer and not await flush():
+        logger.error("Audit events lost on shutdown", extra={"events": len(_buffer)})
+        metrics.incr('audit_dropped', len(_buffer), labels={"reason": "shutdown"})
+        _buffer.clear()
@@ -0,0 +1,262 @@
+# in-memory index of taken usernames and emails per System, for the signup
+# availability check
+#
+# holds the active (isDisabled = 0) usernames and emails of every system,
+# case-folded like SQL Server's default collation compares them. it is
+# built in the background once the service is ready, rebuilt every
+# AVAILABILITY_REBUILD_SECONDS, and kept current in between by the write
+# paths calling note_active()/note_inactive(), here and, through the
+# invalidation channel, on the other workers. a value freed since the last
+# rebuild may still be held by another active account, so lookups for it go
+# to the db until then. AVAILABILITY_INDEX picks:
+#   set    exact hash sets (default)
+#   bloom  a bloom filter per system and kind at AVAILABILITY_BLOOM_FP_RATE,
+#          sized for twice the entries found (about 2.4 bytes each at 1%) so
+#          new signups fit until the next rebuild; "maybe taken" answers are
+#          confirmed in the db
+# the index is advisory: until the first build finishes lookups go to the
+# db, and signup still relies on the unique indexes, so a stale answer
+# costs a retry, never a duplicate. (the sqlite stand-in compares case-
+# sensitively, so there a db answer can differ from the index in case only.)
+import asyncio
+import hashlib
+import math
+import os
+import time
+from dotenv import load_dotenv
+import applog
+import invalidation
+import metrics
+from database import get_db_connection
+
+load_dotenv()
+
+logger = applog.get_logger("availability")
+
+AVAILABILITY_INDEX = os.getenv("AVAILABILITY_INDEX", "set")  # set | bloom
+AVAILABILITY_BLOOM_FP_RATE = float(os.getenv("AVAILABILITY_BLOOM_FP_RATE", 0.01))
+AVAILABILITY_REBUILD_SECONDS = float(os.getenv("AVAILABILITY_REBUILD_SECONDS", 300))
+AVAILABILITY_FETCH_SIZE = int(os.getenv("AVAILABILITY_FETCH_SIZE", 5000))
+
+_COLUMNS = {"username": "Username", "email": "Email"}
+
+
+def normalize(value: str):
+    return value.strip().casefold()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float = AVAILABILITY_BLOOM_FP_RATE):
+        capacity = max(capacity, 1024)
+        self.size = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for p in self._positions(value):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, value: str):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+
+# {(system, kind): set or bloom filter} plus the values freed since the build
+class _Index:
+    def __init__(self, entries: dict, exact: bool):
+        self.exact = exact
+        self.freed: set = set()
+        if exact:
+            self.values = entries
+        else:
+            self.values = {}
+            for key, values in entries.items():
+                bloom = BloomFilter(len(values) * 2)
+                for value in values:
+                    bloom.add(value)
+                self.values[key] = bloom
+
+    def add(self, system: str, kind: str, value: str):
+        key = (system, kind)
+        self.freed.discard((system, kind, value))
+        if self.exact:
+            self.values.setdefault(key, set()).add(value)
+            return
+        if key not in self.values:
+            self.values[key] = BloomFilter(1024)
+        self.values[key].add(value)
+
+    def remove(self, system: str, kind: str, value: str):
+        if self.exact:
+            self.values.get((system, kind), set()).discard(value)
+        # a bloom filter can't forget, and either way another account may
+        # still hold the value
+        self.freed.add((system, kind, value))
+
+    # True taken, False free, None ask the db
+    def taken(self, system: str, kind: str, value: str):
+        if (system, kind, value) in self.freed:
+            return None
+        found = value in self.values.get((system, kind), ())
+        if self.exact:
+            return found
+        if not found:
+            return False
+        return None
+
+    def size(self):
+        if self.exact:
+            return sum(len(v) for v in self.values.values())
+        return sum(len(b.bits) for b in self.values.values())
+
+
+_index: _Index | None = None
+# changes seen while a rebuild is reading the table, replayed onto it
+_journal: list | None = None
+_rebuilder: asyncio.Task | None = None
+
+
+def _apply(op: str, system: str, username: str | None, email: str | None):
+    for kind, value in (("username", username), ("email", email)):
+        if not value:
+            continue
+        value = normalize(value)
+        if _index is not None:
+            if op == "add":
+                _index.add(system, kind, value)
+            else:
+                _index.remove(system, kind, value)
+        if _journal is not None:
+            _journal.append((op, system, kind, value))
+
+# entries: [(system, username, email)]
+def _note(op: str, entries):
+    entries = [entry for entry in entries if entry[0]]
+    for entry in entries:
+        _apply(op, *entry)
+    # chunked so a bulk change stays within one datagram per message
+    for i in range(0, len(entries), 200):
+        invalidation.publish("availability", op=op, entries=entries[i:i + 200])
+
+# an account with these values is now active in system
+def note_active(system: str | None, username: str | None, email: str | None):
+    _note("add", [(system, username, email)])
+
+# the same for many accounts, published once
+def note_active_many(entries):
+    _note("add", entries)
+
+# an account with these values is no longer active in system (disabled,
+# renamed or moved). lookups for them go to the db until the next rebuild,
+# since another active account may still hold one
+def note_inactive(system: str | None, username: str | None, email: str | None):
+    _note("remove", [(system, username, email)])
+
+def _apply_remote(event: dict):
+    for entry in event["entries"]:
+        _apply(event["op"], *entry)
+
+invalidation.subscribe("availability", _apply_remote)
+
+async def _load():
+    entries = {}
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute("SELECT System, Username, Email FROM Users WHERE isDisabled = 0")
+        while True:
+            rows = await cursor.fetchmany(AVAILABILITY_FETCH_SIZE)
+            if not rows:
+                break
+            for system, username, email in rows:
+                if username:
+                    entries.setdefault((system, "username"), set()).add(normalize(username))
+                if email:
+                    entries.setdefault((system, "email"), set()).add(normalize(email))
+            # let requests in between chunks of a large table
+            await asyncio.sleep(0)
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+    return entries
+
+async def rebuild():
+    global _index, _journal
+    started = time.perf_counter()
+    _journal = []
+    try:
+        index = _Index(await _load(), exact=AVAILABILITY_INDEX != "bloom")
+        for op, system, kind, value in _journal:
+            if op == "add":
+                index.add(system, kind, value)
+            else:
+                index.remove(system, kind, value)
+        _index = index
+    finally:
+        _journal = None
+    elapsed = time.perf_counter() - started
+    metrics.observe("availability_rebuild", elapsed)
+    logger.info("Availability index built", extra={"kind": AVAILABILITY_INDEX, "size": _index.size(), "ms": round(elapsed * 1000, 1)})
+
+# entries for set, bytes for bloom
+def _gauges():
+    if _index is not None:
+        yield "availability_index_size", _index.size(), {"kind": AVAILABILITY_INDEX}
+
+metrics.register_collector(_gauges)
+
+async def _db_taken(system: str, kind: str, value: str):
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute(
+            f"SELECT 1 FROM Users WHERE {_COLUMNS[kind]} = ? AND System = ? AND isDisabled = 0",
+            (value.strip(), system)
+        )
+        return await cursor.fetchone() is not None
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+
+async def is_taken(system: str, kind: str, value: str):
+    taken = None
+    if _index is not None:
+        taken = _index.taken(system, kind, normalize(value))
+    if taken is not None:
+        metrics.incr("availability_lookups", labels={"source": "memory"})
+        return taken
+    metrics.incr("availability_lookups", labels={"source": "db"})
+    return await _db_taken(system, kind, value)
+
+async def _rebuild_forever():
+    while True:
+        try:
+            await rebuild()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error building availability index")
+        await asyncio.sleep(AVAILABILITY_REBUILD_SECONDS)
+
+def start():
+    global _rebuilder
+    if _rebuilder is None or _rebuilder.done():
+        _rebuilder = asyncio.create_task(_rebuild_forever())
+
+async def stop():
+    global _rebuilder
+    if _rebuilder is not None:
+        _rebuilder.cancel()
+        try:
+            await _rebuilder
+        except asyncio.CancelledError:
+            pass
+        _rebuilder = None
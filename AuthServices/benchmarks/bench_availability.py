@@ -0,0 +1,69 @@
+# GET /users/availability latency against --users seeded accounts, half the
+# probes taken and half free, with the exact index (AVAILABILITY_INDEX=set)
+# and the bloom filter (taken probes are confirmed in the db there), plus
+# where the answers came from and the index size
+#
+#   python -m benchmarks.bench_availability --users 20000 --probes 500
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import httpx
+from benchmarks.common import BENCH_SYSTEMS, bench_username, run_service, seed_sqlite, summarize
+
+_METRIC = re.compile(r'^auth_availability_(lookups_total\{source="\w+"\}|index_size\{kind="\w+"\}) (\S+)', re.M)
+
+
+async def _wait_for_index(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        resp = await client.get('/metrics')
+        if 'auth_availability_index_size' in resp.text:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError('availability index was not built in time')
+
+async def run(base_url: str, n_users: int, n_probes: int):
+    probes = []
+    for i in range(n_probes):
+        if i % 2:
+            # bench users are spread round robin over BENCH_SYSTEMS
+            j = (i * 7919) % n_users
+            probes.append(({'username': bench_username(j), 'email': f'{bench_username(j)}@example.com', 'system': BENCH_SYSTEMS[j % len(BENCH_SYSTEMS)]}, False))
+        else:
+            probes.append(({'username': f'free_{i}', 'email': f'free_{i}@example.com', 'system': 'OOS'}, True))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await _wait_for_index(client)
+        samples = []
+        for params, available in probes:
+            started = time.perf_counter()
+            resp = await client.get('/users/availability', params=params)
+            samples.append(time.perf_counter() - started)
+            resp.raise_for_status()
+            body = resp.json()
+            assert body['username']['available'] is available and body['email']['available'] is available, body
+        metrics = dict(_METRIC.findall((await client.get('/metrics')).text))
+    return {'latency': summarize(samples), **{k: float(v) for k, v in metrics.items()}}
+
+def main():
+    parser = argparse.ArgumentParser(description='Availability lookups from the exact index versus the bloom filter.')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--probes', type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    seed_sqlite(db_path, args.users)
+    result = {}
+    for kind in ('set', 'bloom'):
+        env = {'AVAILABILITY_INDEX': kind, 'AVAILABILITY_RATE_PER_MINUTE': '1000000', 'AVAILABILITY_BURST': str(args.probes)}
+        with run_service(db_path, env) as base_url:
+            result[kind] = asyncio.run(run(base_url, args.users, args.probes))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# wall time and statements for disabling / re-enabling --users accounts one
+# request at a time (/users/disable/{id}) versus one /users/batch/* call,
+# and for --users password changes via /users/update/{id} versus
+# /users/batch/update (hashing runs in parallel there)
+#
+#   python -m benchmarks.bench_batch --users 200
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import httpx
+from benchmarks.common import login, run_service, seed_sqlite
+
+_STATEMENTS = re.compile(r'^auth_db_query_seconds_count\{op="(?:execute|executemany)"\} (\d+)', re.M)
+
+
+async def _statements(client: httpx.AsyncClient):
+    resp = await client.get('/metrics')
+    resp.raise_for_status()
+    return sum(int(n) for n in _STATEMENTS.findall(resp.text))
+
+async def _timed(client: httpx.AsyncClient, calls):
+    before = await _statements(client)
+    started = time.perf_counter()
+    for call in calls:
+        resp = await call()
+        assert resp.status_code == 200, (resp.status_code, resp.text)
+    elapsed = time.perf_counter() - started
+    return {'elapsed_ms': elapsed * 1000, 'requests': len(calls), 'statements': await _statements(client) - before}
+
+async def run(base_url: str, n_users: int):
+    # seeded bench users are UserID 1..n_users
+    ids = list(range(1, n_users + 1))
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        admin = {'Authorization': f"Bearer {await login(client, 'superadmin', 'superadmin123')}"}
+        enable = lambda: client.post('/users/batch/enable', json={'ids': ids}, headers=admin)
+        return {
+            'disable_sequential': await _timed(client, [
+                (lambda i=i: client.put(f'/users/disable/{i}', headers=admin)) for i in ids
+            ]),
+            'enable_batch': await _timed(client, [enable]),
+            'disable_batch': await _timed(client, [lambda: client.post('/users/batch/disable', json={'ids': ids}, headers=admin)]),
+            'enable_batch_again': await _timed(client, [enable]),
+            'password_sequential': await _timed(client, [
+                (lambda i=i: client.put(f'/users/update/{i}', data={'password': f'rotated-{i}'}, headers=admin)) for i in ids
+            ]),
+            'password_batch': await _timed(client, [lambda: client.post('/users/batch/update', json={
+                'users': [{'id': i, 'password': f'rotated-again-{i}'} for i in ids]
+            }, headers=admin)]),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Sequential per-user admin calls versus one batch call.')
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    seed_sqlite(db_path, args.users)
+    with run_service(db_path) as base_url:
+        result = asyncio.run(run(base_url, args.users))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# POST /auth/introspect with N tokens vs N sequential GET /auth/users/me
+#
+#   python -m benchmarks.bench_introspect --tokens 50 --rounds 20
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import httpx
+from benchmarks.common import bench_username, login, login_many, run_service, seed_sqlite, summarize
+
+
+async def run(base_url: str, n_tokens: int, rounds: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        tokens = await login_many(client, [bench_username(i) for i in range(n_tokens)])
+        # introspection callers authenticate; a superadmin bearer is allowed by default
+        caller = {'Authorization': f"Bearer {await login(client, 'superadmin', 'superadmin123')}"}
+
+        sequential, batch = [], []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for token in tokens:
+                resp = await client.get('/auth/users/me', headers={'Authorization': f'Bearer {token}'})
+                resp.raise_for_status()
+            sequential.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            resp = await client.post('/auth/introspect', json={'tokens': tokens}, headers=caller)
+            resp.raise_for_status()
+            assert all(r['active'] for r in resp.json()['results'])
+            batch.append(time.perf_counter() - started)
+
+    seq, bat = summarize(sequential), summarize(batch)
+    return {
+        'tokens': n_tokens,
+        'rounds': rounds,
+        'sequential_users_me': seq,
+        'batch_introspect': bat,
+        'speedup_p50': seq['p50_ms'] / bat['p50_ms'] if bat['p50_ms'] else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    seed_sqlite(db_path, args.tokens)
+    with run_service(db_path) as base_url:
+        result = asyncio.run(run(base_url, args.tokens, args.rounds))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# cold start: the heaviest imports behind `import main` (from python's
+# -X importtime), then time from spawning uvicorn to /healthz answering
+# (liveness) and to /readyz answering 200 (warmup done), over --runs starts
+#
+#   python -m benchmarks.bench_startup --runs 5 --top 15
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.common import SERVICE_DIR, _free_port, seed_sqlite, summarize
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+# [(module, self_ms, cumulative_ms)] for modules imported by `import main`
+def import_profile(env: dict):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)) / 1000, int(match.group(2)) / 1000))
+    return modules
+
+def _wait_for(url: str, proc, deadline: float):
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f'Service exited during startup with code {proc.returncode}')
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'{url} not ready in time')
+        time.sleep(0.01)
+
+# (seconds to /healthz, seconds to /readyz) for one cold start
+def start_once(env: dict, timeout: float = 60):
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        live = _wait_for(f'{base_url}/healthz', proc, deadline)
+        ready = _wait_for(f'{base_url}/readyz', proc, deadline)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return live - started, ready - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Import profile and cold start time to liveness/readiness.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='heaviest imports to list')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    seed_sqlite(db_path, 10)
+    env = os.environ.copy()
+    env.update({
+        'DB_BACKEND': 'sqlite',
+        'DB_SQLITE_PATH': db_path,
+        'JWT_KEYS_DIR': tempfile.mkdtemp(prefix='bench-keys-'),
+    })
+
+    modules = import_profile(env)
+    main_total = next((cumulative for name, _, cumulative in modules if name == 'main'), None)
+    live, ready = [], []
+    for _ in range(args.runs):
+        to_live, to_ready = start_once(env)
+        live.append(to_live)
+        ready.append(to_ready)
+
+    print(json.dumps({
+        'import_main_ms': main_total,
+        'heaviest_self_ms': [
+            {'module': name, 'self_ms': self_ms, 'cumulative_ms': cumulative}
+            for name, self_ms, cumulative in sorted(modules, key=lambda m: m[1], reverse=True)[:args.top]
+        ],
+        'to_healthz': summarize(live),
+        'to_readyz': summarize(ready),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# statements and latency per write for /users/create, /users/signup-oos and
+# /users/update, including the conflict paths. statement counts come from the
+# service's own /metrics, so they hold for SQL Server too, where each
+# statement is a network round-trip.
+#
+#   python -m benchmarks.bench_writes --requests 50
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import httpx
+from benchmarks.common import BENCH_PASSWORD, bench_username, login, run_service, seed_sqlite, summarize
+
+_STATEMENTS = re.compile(r'^auth_db_query_seconds_count\{op="(?:execute|executemany)"\} (\d+)', re.M)
+
+
+async def _statements(client: httpx.AsyncClient):
+    resp = await client.get('/metrics')
+    resp.raise_for_status()
+    return sum(int(n) for n in _STATEMENTS.findall(resp.text))
+
+async def _measure(client: httpx.AsyncClient, n_requests: int, call, expect: int):
+    samples = []
+    before = await _statements(client)
+    for i in range(n_requests):
+        started = time.perf_counter()
+        resp = await call(i)
+        samples.append(time.perf_counter() - started)
+        assert resp.status_code == expect, (resp.status_code, resp.text)
+    statements = await _statements(client) - before
+    return {**summarize(samples), 'statements_per_request': statements / n_requests}
+
+async def run(base_url: str, n_requests: int):
+    run_id = str(int(time.time()))
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        admin = {'Authorization': f"Bearer {await login(client, 'superadmin', 'superadmin123')}"}
+
+        def user(prefix, i):
+            username = f'{prefix}_{run_id}_{i}'
+            return {
+                'firstName': 'Write', 'lastName': 'Bench', 'username': username, 'password': BENCH_PASSWORD,
+                'email': f'{username}@example.com', 'phoneNumber': '09170000000',
+            }
+
+        taken = {**user('taken', 0), 'username': bench_username(0), 'email': f'{bench_username(0)}@example.com'}
+        results = {
+            'create': await _measure(client, n_requests, lambda i: client.post(
+                '/users/create', data={**user('create', i), 'userRole': 'staff', 'system': 'IMS'}, headers=admin), 200),
+            'create_conflict': await _measure(client, n_requests, lambda i: client.post(
+                '/users/create', data={**taken, 'userRole': 'staff', 'system': 'IMS'}, headers=admin), 400),
+            'signup_oos': await _measure(client, n_requests, lambda i: client.post(
+                '/users/signup-oos', data=user('signup', i)), 200),
+            'signup_oos_conflict': await _measure(client, n_requests, lambda i: client.post(
+                '/users/signup-oos', data=user('signup', i)), 400),
+            'update_profile': await _measure(client, n_requests, lambda i: client.put(
+                f'/users/update/{i + 2}', data={'firstName': f'Renamed{i}'}, headers=admin), 200),
+            'update_email': await _measure(client, n_requests, lambda i: client.put(
+                f'/users/update/{i + 2}', data={'email': f'moved_{run_id}_{i}@example.com'}, headers=admin), 200),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Statements and latency per user write.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    seed_sqlite(db_path, max(args.users, args.requests + 2))
+    with run_service(db_path) as base_url:
+        result = asyncio.run(run(base_url, args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# shared helpers for the benchmark scripts: a seeded sqlite stand-in for the
+# Users tables (built by the schema migrations) and a uvicorn subprocess
+# running main:app against it
+import asyncio
+import contextlib
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import httpx
+import bootstrap
+import database
+import hashing
+import schema
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_PASSWORD = 'benchpass123'
+BENCH_SYSTEMS = ['IMS', 'POS', 'OOS']
+BENCH_ROLES = ['admin', 'manager', 'staff', 'cashier', 'rider']
+
+
+
+def bench_username(i: int):
+    return f'bench_user_{i}'
+
+# fresh sqlite db with n_users active users sharing BENCH_PASSWORD
+def seed_sqlite(path: str, n_users: int):
+    if os.path.exists(path):
+        os.remove(path)
+    # one hash with the service's policy, reused, so logins pay production cost
+    hashed = hashing.context().hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+    rows = []
+    for i in range(n_users):
+        rows.append((
+            hashed, f'{bench_username(i)}@example.com', BENCH_ROLES[i % len(BENCH_ROLES)], 0, now,
+            BENCH_SYSTEMS[i % len(BENCH_SYSTEMS)], bench_username(i), '09170000000', 'Bench', None, f'User{i}', None,
+        ))
+    # the service bootstraps this in the background after it is ready; seeded
+    # here so the first admin login doesn't race it
+    rows.append((
+        hashing.context().hash(bootstrap.ADMIN_PASSWORD), bootstrap.ADMIN_EMAIL, 'superadmin', 0, now,
+        'AUTH', bootstrap.ADMIN_USERNAME, '', 'Super', '', 'Admin', '',
+    ))
+    asyncio.run(schema.upgrade(database.SqliteBackend(path)))
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    try:
+        conn.executemany('''
+            INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# run main:app in a subprocess against db_path; yields the base url
+@contextlib.contextmanager
+def run_service(db_path: str, env: dict | None = None, startup_timeout: float = 60):
+    port = _free_port()
+    keys_dir = tempfile.mkdtemp(prefix='bench-keys-')
+    proc_env = os.environ.copy()
+    proc_env.update({
+        'DB_BACKEND': 'sqlite',
+        'DB_SQLITE_PATH': db_path,
+        'JWT_KEYS_DIR': keys_dir,
+    })
+    proc_env.update(env or {})
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=SERVICE_DIR,
+        env=proc_env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f'Service exited during startup with code {proc.returncode}')
+            try:
+                if httpx.get(f'{base_url}/readyz', timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError('Service did not start in time')
+            time.sleep(0.1)
+        yield base_url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+async def login(client: httpx.AsyncClient, username: str, password: str = BENCH_PASSWORD):
+    resp = await client.post('/auth/token', data={'username': username, 'password': password})
+    resp.raise_for_status()
+    return resp.json()['access_token']
+
+# log in many users, a few at a time so the hashing queue isn't saturated
+async def login_many(client: httpx.AsyncClient, usernames, concurrency: int = 4):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(username):
+        async with sem:
+            return await login(client, username)
+
+    return await asyncio.gather(*(one(u) for u in usernames))
+
+def percentile(sorted_samples, pct: float):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+    }
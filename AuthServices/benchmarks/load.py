@@ -0,0 +1,174 @@
+# load test for the main auth and user endpoints
+#
+# seeds a sqlite stand-in with --users accounts, starts main:app against it
+# and drives --concurrency clients at each scenario for --requests requests.
+# prints throughput and p50/p95/p99 per scenario as json, and compares them
+# with a baseline saved by an earlier run:
+#
+#   python -m benchmarks.load --save-baseline benchmarks/baseline.json
+#   ... change something ...
+#   python -m benchmarks.load --baseline benchmarks/baseline.json --fail-on-regression
+#
+# login throttling is relaxed for the run, otherwise one client ip would be
+# locked out after a few dozen logins. 503s under the bcrypt-bound scenarios
+# mean the hashing queue is shedding load (see HASH_WORKERS/HASH_QUEUE_LIMIT);
+# they are counted as errors, not in throughput.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.common import BENCH_PASSWORD, bench_username, login, login_many, run_service, seed_sqlite, summarize
+
+SCENARIOS = ['token', 'users_me', 'list_users', 'create', 'signup_oos']
+
+BENCH_ENV = {
+    'LOGIN_USER_RATE_PER_MINUTE': '1000000',
+    'LOGIN_USER_BURST': '1000000',
+    'LOGIN_IP_RATE_PER_MINUTE': '1000000',
+    'LOGIN_IP_BURST': '1000000',
+}
+
+
+# each scenario returns an async fn(client, i) that issues one request
+async def _scenario(name: str, client: httpx.AsyncClient, n_users: int, run_id: str):
+    if name == 'token':
+        async def call(i):
+            return await client.post('/auth/token', data={'username': bench_username(i % n_users), 'password': BENCH_PASSWORD})
+        return call
+
+    if name == 'users_me':
+        tokens = await login_many(client, [bench_username(i) for i in range(min(n_users, 20))])
+        async def call(i):
+            return await client.get('/auth/users/me', headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'})
+        return call
+
+    admin = {'Authorization': f"Bearer {await login(client, 'superadmin', 'superadmin123')}"}
+
+    if name == 'list_users':
+        async def call(i):
+            return await client.get('/users/list-users', params={'limit': 100}, headers=admin)
+        return call
+
+    def new_user(i):
+        username = f'load_{name}_{run_id}_{i}'
+        return {
+            'firstName': 'Load', 'lastName': f'User{i}', 'username': username, 'password': BENCH_PASSWORD,
+            'email': f'{username}@example.com', 'phoneNumber': '09170000000',
+        }
+
+    if name == 'create':
+        async def call(i):
+            return await client.post('/users/create', data={**new_user(i), 'userRole': 'staff', 'system': 'IMS'}, headers=admin)
+        return call
+
+    if name == 'signup_oos':
+        async def call(i):
+            return await client.post('/users/signup-oos', data=new_user(i))
+        return call
+
+    raise ValueError(f'Unknown scenario {name}')
+
+async def _drive(call, n_requests: int, concurrency: int):
+    counter = itertools.count()
+    samples, statuses = [], {}
+
+    async def worker():
+        while (i := next(counter)) < n_requests:
+            started = time.perf_counter()
+            try:
+                resp = await call(i)
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            samples.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+    return {
+        **summarize(samples),
+        'elapsed_s': elapsed,
+        'throughput_rps': ok / elapsed if elapsed else 0.0,
+        'errors': len(samples) - ok,
+        'statuses': statuses,
+    }
+
+async def run(base_url: str, scenarios, n_users: int, n_requests: int, concurrency: int):
+    run_id = str(int(time.time()))
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        for name in scenarios:
+            call = await _scenario(name, client, n_users, run_id)
+            # a few untimed requests so connection setup isn't measured
+            for i in range(min(concurrency, 5)):
+                await call(n_requests + i)
+            results[name] = await _drive(call, n_requests, concurrency)
+    return results
+
+# relative change per scenario; a regression is slower p95 or lower throughput beyond tolerance
+def compare(results: dict, baseline: dict, tolerance: float):
+    report, regressions = {}, []
+    for name, current in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        deltas = {}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if before.get(key):
+                deltas[key] = (current[key] - before[key]) / before[key]
+        if deltas.get('p95_ms', 0) > tolerance or deltas.get('throughput_rps', 0) < -tolerance:
+            regressions.append(name)
+        report[name] = deltas
+    return report, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the auth service against a seeded sqlite database.')
+    parser.add_argument('--users', type=int, default=1000, help='seeded user count')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"comma separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument('--baseline', help='compare against this saved result')
+    parser.add_argument('--save-baseline', help='write this run to the given path')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative p95/throughput change')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.sqlite3')
+    seed_sqlite(db_path, args.users)
+    with run_service(db_path, env=BENCH_ENV) as base_url:
+        results = asyncio.run(run(base_url, scenarios, args.users, args.requests, args.concurrency))
+
+    output = {
+        'config': {'users': args.users, 'requests': args.requests, 'concurrency': args.concurrency},
+        'scenarios': results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        output['baseline'], regressions = compare(results, baseline, args.tolerance)
+        output['regressions'] = regressions
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'config': output['config'], 'scenarios': results}, f, indent=2)
+    print(json.dumps(output, indent=2))
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
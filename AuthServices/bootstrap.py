@@ -0,0 +1,82 @@
+# super admin bootstrap
+#
+# creates the superadmin account if no active one exists; safe to run any
+# number of times, from several processes at once. runs in the background
+# after startup unless ADMIN_BOOTSTRAP_ON_STARTUP=false, or one-shot:
+#
+#   python bootstrap.py
+import asyncio
+import os
+from dotenv import load_dotenv
+import applog
+import availability
+import database
+import hashing
+import invalidation
+import userdata
+from database import get_db_connection
+
+load_dotenv()
+
+logger = applog.get_logger("bootstrap")
+
+ADMIN_BOOTSTRAP_ON_STARTUP = os.getenv("ADMIN_BOOTSTRAP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+ADMIN_USERNAME = os.getenv("ADMIN_BOOTSTRAP_USERNAME", "superadmin")
+ADMIN_PASSWORD = os.getenv("ADMIN_BOOTSTRAP_PASSWORD", "superadmin123")
+ADMIN_EMAIL = os.getenv("ADMIN_BOOTSTRAP_EMAIL", "superadmin@example.com")
+
+
+async def _admin_exists(cursor):
+    await cursor.execute("SELECT 1 FROM Users WHERE Username = ? AND isDisabled = 0", (ADMIN_USERNAME,))
+    return await cursor.fetchone() is not None
+
+# True when this call created the account
+async def ensure_admin():
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        if await _admin_exists(cursor):
+            logger.info("Super Admin already exists.")
+            return False
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+
+    hashed_password = await hashing.hash_password(ADMIN_PASSWORD)
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        # another process may have won the race while we were hashing
+        await cursor.execute(
+            f'''INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix)
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM {conn.backend.locked('Users')} WHERE Username = ? AND isDisabled = 0)''',
+            (hashed_password, ADMIN_EMAIL, 'superadmin', 0, 'AUTH', ADMIN_USERNAME, '', 'Super', '', 'Admin', '', ADMIN_USERNAME)
+        )
+        created = cursor.rowcount == 1
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+    if created:
+        userdata.bump()
+        invalidation.publish("principal", usernames=[ADMIN_USERNAME])
+        availability.note_active('AUTH', ADMIN_USERNAME, ADMIN_EMAIL)
+    logger.info("Super Admin created." if created else "Super Admin already exists.")
+    return created
+
+async def _main():
+    try:
+        await database.init_pool(min_size=1)
+        created = await ensure_admin()
+        print("Super Admin created." if created else "Super Admin already exists.")
+    finally:
+        await database.close_pool()
+        hashing.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
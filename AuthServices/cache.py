@@ -0,0 +1,79 @@
+import asyncio
+import time
+from collections import OrderedDict
+import metrics
+
+_MISSING = object()
+
+
+# TTL + LRU cache with single-flight loading; not thread-safe, event loop only
+class TTLCache:
+    def __init__(self, name: str, maxsize: int = 10000, ttl: float = 60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._inflight: dict = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            metrics.incr(f'{self.name}_cache_evictions')
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+            # a load already running for this key must not repopulate it
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self._inflight.clear()
+
+    # return the cached value or run loader() once for all concurrent callers;
+    # None results are not cached
+    async def get_or_load(self, key, loader):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            metrics.incr(f'{self.name}_cache_hits')
+            return value
+
+        future = self._inflight.get(key)
+        if future is None:
+            metrics.incr(f'{self.name}_cache_misses')
+            # own task so a cancelled caller doesn't cancel the shared load
+            future = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = future
+        else:
+            metrics.incr(f'{self.name}_cache_coalesced')
+        return await asyncio.shield(future)
+
+    async def _load(self, key, loader):
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+        except BaseException:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            raise
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            if value is not None:
+                self.set(key, value)
+        return value
@@ -1,20 +1,448 @@
-import aioodbc
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+import applog
+import metrics
+
+load_dotenv()
+
+logger = applog.get_logger("database")
 
 # database config
-server = 'ZEKE\\SQLEXPRESS'
-database = 'retailAuth'
-username = 'zeke'
-password = 'zeke21'
-driver = 'ODBC Driver 17 for SQL Server'
+server = os.getenv('DB_SERVER', 'ZEKE\\SQLEXPRESS')
+database = os.getenv('DB_NAME', 'retailAuth')
+username = os.getenv('DB_USERNAME', 'zeke')
+password = os.getenv('DB_PASSWORD', 'zeke21')
+driver = os.getenv('DB_DRIVER', 'ODBC Driver 17 for SQL Server')
+
+# pool config
+DB_BACKEND = os.getenv('DB_BACKEND', 'odbc')  # odbc | sqlite
+DB_SQLITE_PATH = os.getenv('DB_SQLITE_PATH', 'retailAuth.sqlite3')
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 5))
+POOL_RECYCLE_SECONDS = float(os.getenv('DB_POOL_RECYCLE_SECONDS', 1800))
+# connections idle longer than this get a SELECT 1 before being handed out
+POOL_PING_AFTER_SECONDS = float(os.getenv('DB_POOL_PING_AFTER_SECONDS', 10))
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+# backends — anything with async connect(), ping(conn) and a `name`
+class OdbcBackend:
+    name = 'odbc'
+
+    def __init__(self, dsn: str | None = None):
+        self.dsn = dsn or (
+            f"DRIVER={{{driver}}};"
+            f"SERVER={server};"
+            f"DATABASE={database};"
+            f"UID={username};"
+            f"PWD={password};"
+        )
+
+    async def connect(self):
+        import aioodbc
+        return await aioodbc.connect(dsn=self.dsn, autocommit=True)
+
+    async def ping(self, conn):
+        cursor = await conn.cursor()
+        try:
+            await cursor.execute("SELECT 1")
+            await cursor.fetchone()
+        finally:
+            await cursor.close()
+
+    # cap a SELECT at n rows
+    def limit_sql(self, sql: str, n: int):
+        return sql.replace("SELECT", f"SELECT TOP ({int(n)})", 1)
+
+    # delete at most n matching rows
+    def delete_limit_sql(self, table: str, where: str, n: int):
+        return f"DELETE TOP ({int(n)}) FROM {table} WHERE {where}"
+
+    # table reference for an existence check that must hold until commit
+    def locked(self, table: str):
+        return f"{table} WITH (UPDLOCK, HOLDLOCK)"
+
+    # the error text when exc is a unique index/constraint violation, else None
+    def unique_violation(self, exc: Exception):
+        text = str(exc)
+        if type(exc).__name__ == 'IntegrityError' and ('(2601)' in text or '(2627)' in text):
+            return text
+        return None
+
+    # UPDATE that returns `columns` as they were before the change
+    async def update_returning_old(self, cursor, table: str, assignments: str, assignment_params, where: str, where_params, columns):
+        deleted = ', '.join(f'deleted.{c}' for c in columns)
+        await cursor.execute(
+            f"UPDATE {table} SET {assignments} OUTPUT {deleted} WHERE {where}",
+            tuple(assignment_params) + tuple(where_params),
+        )
+        return await cursor.fetchall()
+
+    # estimated plan for sql, one line per operator; nothing is executed
+    async def explain(self, cursor, sql: str, params=()):
+        await cursor.execute("SET SHOWPLAN_TEXT ON")
+        try:
+            await cursor.execute(sql, tuple(params))
+            lines = []
+            while True:
+                lines += [row[0] for row in await cursor.fetchall()]
+                if not await cursor.nextset():
+                    break
+        finally:
+            await cursor.execute("SET SHOWPLAN_TEXT OFF")
+        return lines
+
+    def is_full_scan(self, plan_line: str):
+        return 'Table Scan' in plan_line or 'Clustered Index Scan' in plan_line
+
+
+# local stand-in, same cursor/commit/close surface as aioodbc
+class SqliteBackend(OdbcBackend):
+    name = 'sqlite'
+
+    def __init__(self, path: str | None = None):
+        self.path = path or DB_SQLITE_PATH
+
+    async def connect(self):
+        import sqlite3
+        import aiosqlite
+        return await aiosqlite.connect(
+            self.path,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            uri=self.path.startswith('file:'),
+        )
+
+    def limit_sql(self, sql: str, n: int):
+        return f"{sql} LIMIT {int(n)}"
+
+    def delete_limit_sql(self, table: str, where: str, n: int):
+        return f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT {int(n)})"
+
+    # sqlite serialises writers, so no hint is needed
+    def locked(self, table: str):
+        return table
+
+    def unique_violation(self, exc: Exception):
+        import sqlite3
+        text = str(exc)
+        if isinstance(exc, sqlite3.IntegrityError) and text.startswith('UNIQUE constraint failed'):
+            return text
+        return None
+
+    # no OUTPUT clause here; the embedded db makes the extra SELECT cheap
+    async def update_returning_old(self, cursor, table: str, assignments: str, assignment_params, where: str, where_params, columns):
+        await cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", tuple(where_params))
+        rows = await cursor.fetchall()
+        if rows:
+            await cursor.execute(
+                f"UPDATE {table} SET {assignments} WHERE {where}",
+                tuple(assignment_params) + tuple(where_params),
+            )
+        return rows
+
+    async def explain(self, cursor, sql: str, params=()):
+        await cursor.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params))
+        return [row[3] for row in await cursor.fetchall()]
+
+    # "SCAN Users" reads the table; "SCAN Users USING INDEX ..." walks an index in order
+    def is_full_scan(self, plan_line: str):
+        return plan_line.startswith('SCAN ') and ' USING ' not in plan_line
+
+
+BACKENDS = {
+    'odbc': OdbcBackend,
+    'sqlite': SqliteBackend,
+}
+
+def register_backend(name: str, factory):
+    BACKENDS[name] = factory
+
+
+class _PoolEntry:
+    __slots__ = ('raw', 'created_at', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = self.last_used = time.monotonic()
+
+
+# times statements and counts fetched rows for /metrics
+class TimedCursor:
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def _timed(self, op: str, call, *args):
+        started = time.perf_counter()
+        try:
+            return await call(*args)
+        finally:
+            metrics.observe('db_query', time.perf_counter() - started, {'op': op})
+
+    async def execute(self, sql, *params):
+        return await self._timed('execute', self._cursor.execute, sql, *params)
+
+    async def executemany(self, sql, params):
+        return await self._timed('executemany', self._cursor.executemany, sql, params)
+
+    async def fetchone(self):
+        row = await self._timed('fetch', self._cursor.fetchone)
+        if row is not None:
+            metrics.incr('db_rows_fetched')
+        return row
+
+    async def fetchall(self):
+        rows = await self._timed('fetch', self._cursor.fetchall)
+        metrics.incr('db_rows_fetched', len(rows))
+        return rows
+
+    async def fetchmany(self, size: int):
+        rows = await self._timed('fetch', self._cursor.fetchmany, size)
+        metrics.incr('db_rows_fetched', len(rows))
+        return rows
+
+    async def close(self):
+        await self._cursor.close()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# handed to callers; close() returns the connection to the pool
+class PooledConnection:
+    def __init__(self, pool, entry: _PoolEntry):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+        self._broken = False
+
+    @property
+    def raw(self):
+        return self._entry.raw
+
+    @property
+    def backend(self):
+        return self._pool.backend
+
+    async def cursor(self):
+        return TimedCursor(await self._entry.raw.cursor())
+
+    async def commit(self):
+        await self._entry.raw.commit()
+
+    async def rollback(self):
+        await self._entry.raw.rollback()
+
+    async def close(self, discard: bool = False):
+        if self._released:
+            return
+        self._released = True
+        await self._pool.release(self._entry, discard=discard or self._broken)
+
+    def __getattr__(self, name):
+        return getattr(self._entry.raw, name)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        backend,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+        recycle_seconds: float = POOL_RECYCLE_SECONDS,
+        ping_after_seconds: float = POOL_PING_AFTER_SECONDS,
+    ):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size")
+        self.backend = backend
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.recycle_seconds = recycle_seconds
+        self.ping_after_seconds = ping_after_seconds
+
+        self._slots = asyncio.Semaphore(max_size)
+        self._idle: list[_PoolEntry] = []
+        self._closed = False
+
+        # metrics
+        self.in_use = 0
+        self.waiting = 0
+        self.opened = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.health_failures = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def open(self):
+        for _ in range(self.min_size):
+            self._idle.append(await self._new_entry())
+
+    async def _new_entry(self):
+        raw = await self.backend.connect()
+        self.opened += 1
+        return _PoolEntry(raw)
+
+    async def _discard(self, entry: _PoolEntry):
+        try:
+            await entry.raw.close()
+        except Exception as e:
+            logger.warning("Error closing pooled connection", extra={"error": str(e)})
+
+    async def _checkout(self):
+        while self._idle:
+            entry = self._idle.pop()
+            now = time.monotonic()
+            if now - entry.created_at > self.recycle_seconds:
+                self.recycled += 1
+                await self._discard(entry)
+                continue
+            if now - entry.last_used > self.ping_after_seconds:
+                try:
+                    await self.backend.ping(entry.raw)
+                except Exception:
+                    self.health_failures += 1
+                    await self._discard(entry)
+                    continue
+            return entry
+        return await self._new_entry()
+
+    async def acquire(self):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeoutError(
+                f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+            )
+        finally:
+            self.waiting -= 1
+
+        try:
+            entry = await self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        metrics.observe('db_pool_wait', waited)
+        self.acquired += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.in_use += 1
+        return PooledConnection(self, entry)
+
+    async def release(self, entry: _PoolEntry, discard: bool = False):
+        self.in_use -= 1
+        try:
+            now = time.monotonic()
+            if discard or self._closed or now - entry.created_at > self.recycle_seconds:
+                await self._discard(entry)
+            else:
+                entry.last_used = now
+                self._idle.append(entry)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for entry in idle:
+            await self._discard(entry)
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": self.in_use,
+            "idle": len(self._idle),
+            "waiting": self.waiting,
+            "opened": self.opened,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+            "health_failures": self.health_failures,
+            "wait_time_total": self.wait_time_total,
+            "wait_time_max": self.wait_time_max,
+            "wait_time_avg": self.wait_time_total / self.acquired if self.acquired else 0.0,
+        }
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = asyncio.Lock()
+
+# create the shared pool (called on app startup)
+async def init_pool(backend=None, **pool_kwargs):
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            if backend is None:
+                backend = BACKENDS[DB_BACKEND]()
+            pool = ConnectionPool(backend, **pool_kwargs)
+            await pool.open()
+            _pool = pool
+    return _pool
+
+# close the shared pool (called on app shutdown)
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+# explicit transaction on a pooled (autocommit) connection; yields a cursor.
+# if the rollback itself fails the connection is dropped instead of reused.
+@asynccontextmanager
+async def transaction(conn):
+    cursor = await conn.cursor()
+    try:
+        await cursor.execute("BEGIN TRANSACTION")
+        try:
+            yield cursor
+            await cursor.execute("COMMIT TRANSACTION")
+        except BaseException:
+            try:
+                await cursor.execute("ROLLBACK TRANSACTION")
+            except Exception:
+                conn._broken = True
+            raise
+    finally:
+        await cursor.close()
+
+def pool_stats():
+    return _pool.stats() if _pool else {}
+
+def _pool_gauges():
+    stats = pool_stats()
+    for name in ('in_use', 'idle', 'waiting', 'max_size', 'opened', 'timeouts', 'recycled', 'health_failures'):
+        if name in stats:
+            yield f'db_pool_{name}', stats[name], None
+
+metrics.register_collector(_pool_gauges)
 
-# async function to get db connection
+# async function to get db connection — conn.close() hands it back to the pool
 async def get_db_connection():
-    dsn = (
-        f"DRIVER={{{driver}}};"
-        f"SERVER={server};"
-        f"DATABASE={database};"
-        f"UID={username};"
-        f"PWD={password};"
-    )
-    conn = await aioodbc.connect(dsn=dsn, autocommit=True)
-    return conn
\ No newline at end of file
+    pool = _pool or await init_pool()
+    return await pool.acquire()
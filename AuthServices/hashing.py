@@ -0,0 +1,184 @@
+# password hashing — one policy for every hash and verify in the service
+#
+# PASSWORD_SCHEME picks bcrypt (default) or argon2 (needs argon2-cffi) for new
+# hashes; the other scheme is still verified. the cost comes from
+# BCRYPT_ROUNDS / ARGON2_TIME_COST, or, when PASSWORD_HASH_TARGET_MS is set
+# instead, is calibrated on this host at startup. hashes made with another
+# scheme or cost report needs_update and are rehashed on the next login.
+#
+#   python hashing.py calibrate 50    # suggested settings for ~50 ms per hash
+import asyncio
+import math
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import applog
+import metrics
+
+logger = applog.get_logger("hashing")
+
+# bcrypt releases the GIL while hashing, so a thread pool gets real parallelism
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', os.cpu_count() or 2))
+# jobs allowed to wait for a worker before new ones are rejected
+HASH_QUEUE_LIMIT = int(os.getenv('HASH_QUEUE_LIMIT', HASH_WORKERS * 4))
+
+PASSWORD_SCHEME = os.getenv('PASSWORD_SCHEME', 'bcrypt')  # bcrypt | argon2
+PASSWORD_HASH_TARGET_MS = os.getenv('PASSWORD_HASH_TARGET_MS')
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', 10))
+BCRYPT_MAX_ROUNDS = int(os.getenv('BCRYPT_MAX_ROUNDS', 16))
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', 3))
+ARGON2_MEMORY_KIB = int(os.getenv('ARGON2_MEMORY_KIB', 65536))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 2))
+
+SCHEMES = ('bcrypt', 'argon2')
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+_executor: ThreadPoolExecutor | None = None
+_pending = 0
+_context = None
+_settings: dict = {}
+_dummy_hash: str | None = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='hashing')
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def pending():
+    return _pending
+
+metrics.register_collector(lambda: [('password_hashing_pending', _pending, None)])
+
+# run a cpu-bound hashing call on the hashing pool; op names the latency stat
+async def run(op: str, fn, *args):
+    global _pending
+    if _pending >= HASH_WORKERS + HASH_QUEUE_LIMIT:
+        metrics.incr(f'password_{op}_rejected')
+        raise HashingBusyError("Password hashing queue is full")
+
+    def timed():
+        started = time.perf_counter()
+        result = fn(*args)
+        return result, started, time.perf_counter()
+
+    _pending += 1
+    queued = time.perf_counter()
+    try:
+        result, started, finished = await asyncio.get_running_loop().run_in_executor(_get_executor(), timed)
+    finally:
+        _pending -= 1
+
+    metrics.observe(f'password_{op}_queue_wait', started - queued)
+    metrics.observe(f'password_{op}', finished - started)
+    return result
+
+# hashes made with anything but exactly these settings need an update
+def configure(scheme: str = PASSWORD_SCHEME, bcrypt_rounds: int = BCRYPT_ROUNDS, argon2_time_cost: int = ARGON2_TIME_COST):
+    global _context, _settings, _dummy_hash
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown PASSWORD_SCHEME {scheme!r}")
+    if scheme == 'argon2':
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            raise RuntimeError("PASSWORD_SCHEME=argon2 requires the argon2-cffi package")
+    # passlib is slow to import; loaded here so importing the app stays cheap
+    from passlib.context import CryptContext
+    _settings = {'scheme': scheme, 'bcrypt_rounds': bcrypt_rounds, 'argon2_time_cost': argon2_time_cost}
+    _dummy_hash = None
+    _context = CryptContext(
+        schemes=[scheme] + [s for s in SCHEMES if s != scheme],
+        default=scheme,
+        deprecated=[s for s in SCHEMES if s != scheme],
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=ARGON2_MEMORY_KIB,
+        argon2__parallelism=ARGON2_PARALLELISM,
+    )
+    return _settings
+
+def context():
+    if _context is None:
+        configure()
+    return _context
+
+def settings():
+    context()
+    return dict(_settings)
+
+def _fastest(fn, runs: int = 3):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# cost for scheme that takes about target_ms per hash on this host (blocking)
+def calibrate(target_ms: float, scheme: str = PASSWORD_SCHEME):
+    target = target_ms / 1000
+    if scheme == 'bcrypt':
+        from passlib.hash import bcrypt
+        handler = bcrypt.using(rounds=BCRYPT_MIN_ROUNDS)
+        base = _fastest(lambda: handler.hash('calibration'))
+        # each round doubles the work
+        rounds = BCRYPT_MIN_ROUNDS + round(math.log2(target / base)) if target > base else BCRYPT_MIN_ROUNDS
+        return {'scheme': scheme, 'bcrypt_rounds': min(BCRYPT_MAX_ROUNDS, rounds)}
+    from passlib.hash import argon2
+    handler = argon2.using(time_cost=1, memory_cost=ARGON2_MEMORY_KIB, parallelism=ARGON2_PARALLELISM)
+    per_pass = _fastest(lambda: handler.hash('calibration'))
+    return {'scheme': scheme, 'argon2_time_cost': max(1, round(target / per_pass))}
+
+# startup: calibrate when only a target is given, otherwise use the configured cost
+async def setup():
+    if PASSWORD_HASH_TARGET_MS and not os.getenv('BCRYPT_ROUNDS') and not os.getenv('ARGON2_TIME_COST'):
+        chosen = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), calibrate, float(PASSWORD_HASH_TARGET_MS), PASSWORD_SCHEME
+        )
+        configure(**chosen)
+    else:
+        configure()
+    logger.info("Password hashing configured", extra=_settings)
+
+async def hash_password(password: str) -> str:
+    return await run('hash', context().hash, password)
+
+# (matches, needs_update) — needs_update means rehash with the current policy
+async def verify_password(password: str, hashed: str):
+    ctx = context()
+    ok = await run('verify', ctx.verify, password, hashed)
+    return ok, ok and ctx.needs_update(hashed)
+
+# a verify against a throwaway hash, for logins with no matching user
+async def dummy_verify(password: str):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await run('hash', context().hash, secrets.token_urlsafe(16))
+    await run('verify', context().verify, password, _dummy_hash)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "calibrate":
+        chosen = calibrate(float(sys.argv[2]))
+        for key, value in chosen.items():
+            print(f"{key.upper() if key != 'scheme' else 'PASSWORD_SCHEME'}={value}")
+    else:
+        print("usage: python hashing.py calibrate <target ms>")
+        sys.exit(1)
@@ -0,0 +1,116 @@
+# cross-worker invalidation
+#
+# with several worker processes (see serve.py) every worker has its own
+# principal cache and revocation state. a change made on one worker is
+# published here and applied by the others: each worker binds a unix
+# datagram socket in INVALIDATION_DIR, and publish() sends the event to every
+# other socket in that directory. delivery is best effort and local to the
+# host; a lost message leaves a worker stale for at most the cache TTL.
+# without INVALIDATION_DIR (a single process) publish() does nothing.
+import asyncio
+import json
+import os
+import socket
+import applog
+import metrics
+
+logger = applog.get_logger("invalidation")
+
+INVALIDATION_DIR = os.getenv("INVALIDATION_DIR")
+# well under the default unix datagram limit
+_MAX_MESSAGE_BYTES = 64 * 1024
+
+_handlers: dict = {}
+_sock: socket.socket | None = None
+_path: str | None = None
+
+
+# handler(payload) runs on the event loop for every event of this kind
+# published by another worker
+def subscribe(kind: str, handler):
+    _handlers[kind] = handler
+
+def _peers():
+    try:
+        names = os.listdir(INVALIDATION_DIR)
+    except FileNotFoundError:
+        return []
+    paths = (os.path.join(INVALIDATION_DIR, name) for name in names if name.endswith(".sock"))
+    return [path for path in paths if path != _path]
+
+def publish(kind: str, **payload):
+    if _sock is None:
+        return
+    data = json.dumps({"kind": kind, **payload}).encode()
+    if len(data) > _MAX_MESSAGE_BYTES:
+        logger.warning("Invalidation message too large, not sent", extra={"kind": kind, "bytes": len(data)})
+        metrics.incr('invalidation_dropped', labels={"kind": kind, "reason": "size"})
+        return
+    for peer in _peers():
+        try:
+            _sock.sendto(data, peer)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # socket left behind by a worker that died without cleaning up
+            try:
+                os.unlink(peer)
+            except FileNotFoundError:
+                pass
+        except BlockingIOError:
+            # that worker's receive buffer is full
+            metrics.incr('invalidation_dropped', labels={"kind": kind, "reason": "full"})
+        except OSError as e:
+            logger.warning("Invalidation send failed", extra={"peer": peer, "error": str(e)})
+    metrics.incr('invalidation_published', labels={"kind": kind})
+
+def _on_readable():
+    while True:
+        try:
+            data = _sock.recv(_MAX_MESSAGE_BYTES)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            return
+        try:
+            message = json.loads(data)
+            kind = message.pop("kind")
+        except (ValueError, KeyError):
+            logger.warning("Malformed invalidation message")
+            continue
+        handler = _handlers.get(kind)
+        if handler is None:
+            continue
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Invalidation handler failed", extra={"kind": kind})
+        metrics.incr('invalidation_received', labels={"kind": kind})
+
+async def start():
+    global _sock, _path
+    if _sock is not None or not INVALIDATION_DIR:
+        return
+    if not hasattr(socket, "AF_UNIX"):
+        logger.warning("Unix sockets unavailable, cross-worker invalidation disabled")
+        return
+    os.makedirs(INVALIDATION_DIR, exist_ok=True)
+    path = os.path.join(INVALIDATION_DIR, f"worker-{os.getpid()}.sock")
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.setblocking(False)
+    _sock, _path = sock, path
+    asyncio.get_running_loop().add_reader(sock.fileno(), _on_readable)
+    logger.info("Invalidation channel open", extra={"path": path})
+
+async def stop():
+    global _sock, _path
+    if _sock is None:
+        return
+    asyncio.get_running_loop().remove_reader(_sock.fileno())
+    _sock.close()
+    try:
+        os.unlink(_path)
+    except FileNotFoundError:
+        pass
+    _sock, _path = None, None
@@ -0,0 +1,92 @@
+# local verification of auth service tokens for downstream services
+#
+# copy this file (it only needs python-jose) and verify tokens against the
+# cached JWKS instead of calling /auth/users/me on every request:
+#
+#   verifier = JWKSVerifier("http://127.0.0.1:4000/auth/.well-known/jwks.json")
+#   claims = verifier.verify(token)              # raises JWTError
+#   claims = await verifier.verify_async(token)  # refreshes keys off the loop
+#
+# claims carry sub, role, system and exp. keys are re-fetched when the cache
+# age from the endpoint runs out, or when a token names an unknown kid
+# (at most once per min_refresh_seconds).
+import asyncio
+import json
+import re
+import threading
+import time
+import urllib.request
+from jose import JWTError, jwk, jwt
+
+
+class JWKSVerifier:
+    def __init__(
+        self,
+        jwks_url: str,
+        default_max_age: float = 300,
+        min_refresh_seconds: float = 30,
+        timeout: float = 5,
+        algorithms=("RS256", "RS384", "RS512", "ES256", "ES384", "ES512"),
+    ):
+        self.jwks_url = jwks_url
+        self.default_max_age = default_max_age
+        self.min_refresh_seconds = min_refresh_seconds
+        self.timeout = timeout
+        self.algorithms = list(algorithms)
+        self._keys: dict = {}
+        self._expires_at = 0.0
+        self._fetched_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as resp:
+            doc = json.loads(resp.read())
+            match = re.search(r"max-age=(\d+)", resp.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else self.default_max_age
+        keys = {}
+        for entry in doc.get("keys", []):
+            if entry.get("alg") in self.algorithms and "kid" in entry:
+                keys[entry["kid"]] = jwk.construct(entry, entry["alg"])
+        return keys, max_age
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now < self._expires_at:
+                return
+            if force and now - self._fetched_at < self.min_refresh_seconds:
+                return
+            keys, max_age = self._fetch()
+            self._keys = keys
+            self._fetched_at = now
+            self._expires_at = now + max_age
+
+    def _needs_refresh(self, kid):
+        return time.monotonic() >= self._expires_at or kid not in self._keys
+
+    def _decode(self, token, kid):
+        key = self._keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown key id")
+        return jwt.decode(token, key, algorithms=self.algorithms)
+
+    def verify(self, token: str):
+        kid = jwt.get_unverified_header(token).get("kid")
+        if self._needs_refresh(kid):
+            try:
+                self.refresh(force=kid not in self._keys)
+            except OSError:
+                # auth service unreachable — keep verifying with the keys we have
+                if kid not in self._keys:
+                    raise
+        return self._decode(token, kid)
+
+    async def verify_async(self, token: str):
+        kid = jwt.get_unverified_header(token).get("kid")
+        if self._needs_refresh(kid):
+            try:
+                await asyncio.to_thread(self.refresh, kid not in self._keys)
+            except OSError:
+                if kid not in self._keys:
+                    raise
+        return self._decode(token, kid)
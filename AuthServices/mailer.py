@@ -0,0 +1,318 @@
+# outbound mail queue
+#
+# messages are spooled to MAIL_SPOOL_DIR as json before they are queued and
+# deleted once delivered, so anything undelivered is picked up again on the
+# next start. each worker keeps one SMTP session open, sends whatever is
+# queued in batches over it, reconnects when the server drops it and closes
+# it after MAIL_IDLE_SECONDS without work. failed sends are retried with
+# exponential backoff; after MAIL_MAX_ATTEMPTS they move to <spool>/failed.
+# spooled messages record the pid that queued them; on start a process only
+# takes over messages whose owner is gone, so several workers sharing one
+# spool don't send the same mail twice.
+#
+# spool files are readable by the service user only. a message queued with
+# expires_at (a reset link, say) is dropped once that passes instead of being
+# sent, and reaches <spool>/failed without its body. failed items are purged
+# after MAIL_FAILED_RETENTION_SECONDS.
+#
+# for local testing point SMTP_SERVER/SMTP_PORT at a stand-in such as
+# `python -m aiosmtpd -n -l 127.0.0.1:8025` and set SMTP_STARTTLS=false.
+import asyncio
+import json
+import os
+import smtplib
+import time
+import uuid
+from email.message import EmailMessage
+from dotenv import load_dotenv
+import applog
+import metrics
+
+load_dotenv()
+
+logger = applog.get_logger("mailer")
+
+SMTP_SERVER = os.getenv("SMTP_SERVER")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+EMAIL_FROM = os.getenv("EMAIL_FROM")
+
+MAIL_SPOOL_DIR = os.getenv("MAIL_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mail_spool"))
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 1))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 6))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", 10))
+MAIL_RETRY_MAX_SECONDS = float(os.getenv("MAIL_RETRY_MAX_SECONDS", 900))
+MAIL_IDLE_SECONDS = float(os.getenv("MAIL_IDLE_SECONDS", 60))
+MAIL_FAILED_RETENTION_SECONDS = float(os.getenv("MAIL_FAILED_RETENTION_SECONDS", 7 * 24 * 3600))
+
+# errors a retry won't fix
+_PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPNotSupportedError)
+
+
+def _spool_path(message_id: str, failed: bool = False):
+    if failed:
+        return os.path.join(MAIL_SPOOL_DIR, "failed", f"{message_id}.json")
+    return os.path.join(MAIL_SPOOL_DIR, f"{message_id}.json")
+
+def _spool_write(message: dict, failed: bool = False):
+    path = _spool_path(message["id"], failed)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(message, f)
+    os.replace(tmp, path)
+
+def _expired(message: dict):
+    expires_at = message.get("expires_at")
+    return expires_at is not None and expires_at <= time.time()
+
+# failed items past their retention, or time-limited ones past expiry
+def _purge_failed():
+    failed_dir = os.path.join(MAIL_SPOOL_DIR, "failed")
+    if not os.path.isdir(failed_dir):
+        return
+    cutoff = time.time() - MAIL_FAILED_RETENTION_SECONDS
+    for name in os.listdir(failed_dir):
+        path = os.path.join(failed_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff or _expired(_read(path)):
+                os.remove(path)
+        except (OSError, ValueError):
+            continue
+
+def _spool_remove(message_id: str):
+    try:
+        os.remove(_spool_path(message_id))
+    except FileNotFoundError:
+        pass
+
+def _owner_alive(pid):
+    if pid is None or pid == os.getpid():
+        return False
+    if os.name == "nt":
+        # os.kill would terminate it; assume single-process deployments there
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _read(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+# take over one orphaned spool file; None if another process owns or took it
+def _claim(name: str):
+    path = os.path.join(MAIL_SPOOL_DIR, name)
+    claimed = f"{path}.claim-{os.getpid()}"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    try:
+        message = _read(claimed)
+    except (OSError, ValueError):
+        os.rename(claimed, path)
+        raise
+    if _owner_alive(message.get("owner")):
+        # a live process rewrote it between our listing and the rename
+        os.rename(claimed, path)
+        return None
+    message["owner"] = os.getpid()
+    _spool_write(message)
+    os.remove(claimed)
+    return message
+
+def _spool_load():
+    if not os.path.isdir(MAIL_SPOOL_DIR):
+        return []
+    messages = []
+    for name in sorted(os.listdir(MAIL_SPOOL_DIR)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            if _owner_alive(_read(os.path.join(MAIL_SPOOL_DIR, name)).get("owner")):
+                continue
+            message = _claim(name)
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable spooled mail", extra={"file": name, "error": str(e)})
+            continue
+        if message is None:
+            continue
+        if _expired(message):
+            _spool_remove(message["id"])
+            metrics.incr('mail_expired')
+            continue
+        messages.append(message)
+    return messages
+
+# one long-lived SMTP connection; used from a worker thread only
+class _SmtpSession:
+    def __init__(self):
+        self.server: smtplib.SMTP | None = None
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_USERNAME:
+            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        self.server = server
+        metrics.incr('mail_smtp_connects')
+
+    def _send(self, message: dict):
+        msg = EmailMessage()
+        msg['Subject'] = message["subject"]
+        msg['From'] = EMAIL_FROM
+        msg['To'] = message["to"]
+        msg.set_content(message["body"])
+        if self.server is None:
+            self._connect()
+        self.server.send_message(msg)
+
+    # returns [(message, error or None)]
+    def send_batch(self, messages: list):
+        results = []
+        for message in messages:
+            try:
+                try:
+                    self._send(message)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # stale session — reconnect once and retry this message
+                    self.close()
+                    self._send(message)
+                results.append((message, None))
+            except Exception as e:
+                if not isinstance(e, _PERMANENT_ERRORS):
+                    self.close()
+                results.append((message, e))
+        return results
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+_retry_handles: set = set()
+
+def _schedule_retry(message: dict):
+    delay = min(MAIL_RETRY_MAX_SECONDS, MAIL_RETRY_BASE_SECONDS * 2 ** (message["attempts"] - 1))
+    loop = asyncio.get_running_loop()
+
+    def requeue():
+        _retry_handles.discard(handle)
+        if _queue is not None:
+            _queue.put_nowait(message)
+
+    handle = loop.call_later(delay, requeue)
+    _retry_handles.add(handle)
+
+def _handle_results(results):
+    for message, error in results:
+        if error is None:
+            _spool_remove(message["id"])
+            metrics.incr('mail_sent')
+            continue
+        message["attempts"] += 1
+        message["last_error"] = str(error)
+        logger.warning("Error sending email", extra={"to": message["to"], "attempt": message["attempts"], "error": str(error)})
+        if isinstance(error, _PERMANENT_ERRORS) or message["attempts"] >= MAIL_MAX_ATTEMPTS:
+            if message.get("expires_at") is not None:
+                # keep the record, not the link
+                message = {**message, "body": None}
+            _spool_write(message, failed=True)
+            _spool_remove(message["id"])
+            metrics.incr('mail_failed')
+        else:
+            _spool_write(message)
+            metrics.incr('mail_retried')
+            _schedule_retry(message)
+
+async def _worker():
+    session = _SmtpSession()
+    try:
+        while True:
+            try:
+                first = await asyncio.wait_for(_queue.get(), MAIL_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(session.close)
+                continue
+            batch = [first]
+            while len(batch) < MAIL_BATCH_SIZE and not _queue.empty():
+                batch.append(_queue.get_nowait())
+            expired = [m for m in batch if _expired(m)]
+            if expired:
+                batch = [m for m in batch if not _expired(m)]
+                for message in expired:
+                    await asyncio.to_thread(_spool_remove, message["id"])
+                    metrics.incr('mail_expired')
+                if not batch:
+                    continue
+            started = time.perf_counter()
+            results = await asyncio.to_thread(session.send_batch, batch)
+            metrics.observe('mail_send_batch', time.perf_counter() - started)
+            _handle_results(results)
+    finally:
+        await asyncio.to_thread(session.close)
+
+# queue a plain-text email; returns once it is spooled. expires_at (unix
+# time) marks mail that is useless, or unsafe to keep, after that
+async def enqueue(to: str, subject: str, body: str, expires_at: float | None = None):
+    message = {
+        "id": f"{time.time_ns()}-{uuid.uuid4().hex[:8]}", "to": to, "subject": subject, "body": body,
+        "attempts": 0, "owner": os.getpid(), "expires_at": expires_at,
+    }
+    await asyncio.to_thread(_spool_write, message)
+    metrics.incr('mail_queued')
+    if _queue is not None:
+        _queue.put_nowait(message)
+    # otherwise it stays spooled until start()
+    return message["id"]
+
+def queued():
+    return _queue.qsize() if _queue is not None else 0
+
+metrics.register_collector(lambda: [('mail_queue_size', queued(), None)])
+
+async def start():
+    global _queue
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue()
+    await asyncio.to_thread(_purge_failed)
+    for message in await asyncio.to_thread(_spool_load):
+        _queue.put_nowait(message)
+    for _ in range(MAIL_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+# stop workers; anything unsent stays in the spool for the next start
+async def stop():
+    global _queue
+    for handle in _retry_handles:
+        handle.cancel()
+    _retry_handles.clear()
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _workers.clear()
+    _queue = None
@@ -1,76 +1,240 @@
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import MutableHeaders
+import asyncio
 import os
+import time
+import uuid
+import applog
+import auditlog
+import availability
+import bootstrap
+import database
+import hashing
+import invalidation
+import mailer
+import metrics
+from origins import RegistryCORSMiddleware
+import reset_tokens
+import revocation
+import schema
+import signing
 
 # routers
 from routers import users
 from routers import auth
+from routers import bulk
+from routers import batch
+from routers import audit
+
+logger = applog.get_logger("main")
 
 app = FastAPI(title="Retail Auth Service")
 
+# startup is kept short: the process starts answering /healthz right away
+# while the pool, hashing policy, signing keys and revocation list warm up
+# concurrently in the background. /readyz (and every other route) answers
+# 503 until that finishes. the superadmin bootstrap runs after readiness and
+# never blocks it (see bootstrap.py), and so does the first build of the
+# signup availability index, which is answered from the db until then. with STARTUP_WAIT_READY the startup
+# hook waits for warmup instead, so a worker that shares its listening socket
+# with others (serve.py) only accepts connections once it can serve them.
+STARTUP_WAIT_READY = os.getenv("STARTUP_WAIT_READY", "false").lower() in ("1", "true", "yes")
+
+_ready = False
+_warmup_steps: dict = {}
+_warmup_error = None
+_background_tasks: set = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def _step(name, coro):
+    _warmup_steps[name] = "pending"
+    started = time.perf_counter()
+    await coro
+    metrics.observe('startup_step', time.perf_counter() - started, {"step": name})
+    _warmup_steps[name] = "done"
+
+async def _warm_hashing():
+    await hashing.setup()
+    # first hash and verify pay for loading the backend
+    await hashing.dummy_verify("warmup")
+
+async def _warmup():
+    global _ready, _warmup_error
+    started = time.perf_counter()
+    try:
+        if schema.DB_MIGRATE_ON_STARTUP:
+            await _step("migrations", schema.upgrade())
+        await asyncio.gather(
+            _step("db_pool", database.init_pool()),
+            _step("hashing", _warm_hashing()),
+            _step("signing_keys", asyncio.to_thread(signing.load_keys)),
+        )
+        # every mode checks the token version; only stateless mode skips the db
+        # for disabled accounts
+        await _step("token_versions", revocation.load_versions())
+        if auth.STATELESS_AUTH:
+            await _step("revocation", revocation.load_disabled())
+    except Exception as e:
+        _warmup_error = f"{type(e).__name__}: {e}"
+        logger.exception("Warmup failed")
+        return
+    _ready = True
+    reset_tokens.start_sweeper()
+    availability.start()
+    metrics.set_gauge('ready', 1)
+    logger.info("Ready", extra={"warmup_ms": round((time.perf_counter() - started) * 1000, 1)})
+    if bootstrap.ADMIN_BOOTSTRAP_ON_STARTUP:
+        _spawn(_bootstrap_admin())
+
+async def _bootstrap_admin():
+    try:
+        await bootstrap.ensure_admin()
+    except Exception:
+        logger.exception("Super Admin bootstrap failed")
+
+@app.on_event("startup")
+async def open_db_pool():
+    applog.setup_logging()
+    metrics.set_gauge('ready', 0)
+    await invalidation.start()
+    await mailer.start()
+    auditlog.start()
+    warmup = _spawn(_warmup())
+    if STARTUP_WAIT_READY:
+        await warmup
+        if not _ready:
+            raise RuntimeError(f"Warmup failed: {_warmup_error}")
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await reset_tokens.stop_sweeper()
+    await availability.stop()
+    await mailer.stop()
+    await auditlog.stop()
+    await invalidation.stop()
+    await database.close_pool()
+    hashing.shutdown()
+    applog.shutdown_logging()
+
+# liveness: the process is up and the event loop is turning
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# readiness: warmup finished, requests will be served
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if _ready:
+        return {"status": "ready"}
+    pending = [name for name, state in _warmup_steps.items() if state != "done"]
+    content = {"status": "failed" if _warmup_error else "starting", "pending": pending}
+    if _warmup_error:
+        content["error"] = _warmup_error
+    return JSONResponse(status_code=503, content=content, headers={"Retry-After": "1"})
+
+# pool exhausted — shed load instead of hanging the request
+@app.exception_handler(database.PoolTimeoutError)
+async def pool_timeout_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Service busy, please retry."}, headers={"Retry-After": "1"})
+
+# prometheus scrape target
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # include routers
 app.include_router(auth.router, prefix='/auth', tags=['auth'])
 app.include_router(users.router, prefix='/users', tags=['users'])
+app.include_router(bulk.router, prefix='/users', tags=['users'])
+app.include_router(batch.router, prefix='/users', tags=['users'])
+app.include_router(audit.router, prefix='/audit', tags=['audit'])
 
 
-# CORS setup to allow frontend and backend 
+# CORS setup to allow frontend and backend — origins are listed per service
+# in cors.json (see origins.py), reloaded when the file changes
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        # SUSUNTUKIN Q GOMALAW
-        "http://192.168.100.14:4002", # ums frontend
-        "http://localhost:4002",  # ums frontend
-
-        # IMS frontend and services
-        "http://localhost:3000",  # ims frontend
-        "http://192.168.100.14:3000",  # ims frontend (local network)
-        "http://127.0.0.1:8001",  # ims (productservice)
-        "http://localhost:8001", 
-        "http://127.0.0.1:8002",  # ims (ingredientservice)
-        "http://localhost:8002",  
-        "http://127.0.0.1:8003",  # ims (materialservice) 
-        "http://localhost:8003", 
-        "http://127.0.0.1:8004",  # ims (merchandiseservice)
-        "http://localhost:8004", 
-        "http://127.0.0.1:8005",  # ims (recipeservice)
-        "http://localhost:8005", 
-        "http://127.0.0.1:8006",  # ims (wasteservice)
-        "http://localhost:8006", 
-
-        # OOS frontend and services
-        "http://localhost:5000",  # oos frontend
-        "http://192.168.100.14:5000",  # oos frontend (local network)
-        "http://127.0.0.1:7001",  # oos (deliveryservice)
-        "http://localhost:7001", 
-        "http://127.0.0.1:7002",  # oos (menuservice)
-        "http://localhost:7002", 
-        "http://127.0.0.1:7003",  # oos (notificationservice)
-        "http://localhost:7003",  
-        "http://127.0.0.1:7004",  # oos (orderingservice) 
-        "http://localhost:7004", 
-        "http://127.0.0.1:7005",  # oos (paymentservice)
-        "http://localhost:7005", 
-        "http://127.0.0.1:7006",  # oos (userservice)
-        "http://localhost:7006",       
-
-        # POS frontend and services
-        "http://localhost:4001",
-        "http://192.168.100.10:4001",
-        "http://localhost:9000",
-        "http://127.0.0.1:9000", 
-        "http://localhost:9001",
-        "http://127.0.0.1:9001", 
-        "http://localhost:9002",
-        "http://127.0.0.1:9002",  
-    ],
+    RegistryCORSMiddleware,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "X-Request-ID"],
 )
 
-# run app
+# request id + latency per route template; outermost, so it also sees
+# preflights answered by the CORS middleware
+class RequestTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = applog.request_id_var.set(request_id)
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Request-ID", request_id)
+            await send(message)
+
+        metrics.add_gauge('http_requests_in_flight', 1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.add_gauge('http_requests_in_flight', -1)
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            metrics.observe('http_request', elapsed, labels)
+            metrics.incr('http_requests', labels={**labels, "status": status_code})
+            applog.request_id_var.reset(token)
+
+# until warmup is done only the probes and /metrics are served; everything
+# else gets a fast 503 instead of waiting on a pool that isn't there yet
+class ReadinessGateMiddleware:
+    OPEN_PATHS = ("/healthz", "/readyz", "/metrics")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _ready or scope["type"] != "http" or scope["path"] in self.OPEN_PATHS:
+            await self.app(scope, receive, send)
+            return
+        metrics.incr('not_ready_rejections')
+        response = JSONResponse(status_code=503, content={"detail": "Service starting, please retry."}, headers={"Retry-After": "1"})
+        await response(scope, receive, send)
+
+app.add_middleware(ReadinessGateMiddleware)
+app.add_middleware(RequestTimingMiddleware)
+
+# hashing pool saturated — reject fast rather than queue behind bcrypt
+@app.exception_handler(hashing.HashingBusyError)
+async def hashing_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Service busy, please retry."}, headers={"Retry-After": "1"})
+
+# run app — local development; production runs through serve.py
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", port=4000, host="127.0.0.1", reload=True)
\ No newline at end of file
+    # auto-reload is for local development only
+    uvicorn.run("main:app", port=4000, host="127.0.0.1", reload=os.getenv("UVICORN_RELOAD", "false").lower() in ("1", "true", "yes"))
\ No newline at end of file
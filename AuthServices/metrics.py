@@ -0,0 +1,131 @@
+# in-process counters, gauges and latency histograms, rendered in the
+# prometheus text format by /metrics. names are given without the `auth_`
+# prefix or unit suffix; histograms are in seconds.
+from bisect import bisect_left
+
+PREFIX = 'auth_'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_counters: dict[tuple, float] = {}
+_gauges: dict[tuple, float] = {}
+_latencies: dict[tuple, "LatencyStat"] = {}
+_collectors: list = []
+
+
+class LatencyStat:
+    __slots__ = ('count', 'total', 'max', 'buckets', 'bucket_counts')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.bucket_counts[bisect_left(self.buckets, seconds)] += 1
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "avg": self.total / self.count if self.count else 0.0,
+        }
+
+
+def _key(name: str, labels: dict | None):
+    return (name, tuple(sorted(labels.items())) if labels else ())
+
+def incr(name: str, amount: float = 1, labels: dict | None = None):
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name: str, value: float, labels: dict | None = None):
+    _gauges[_key(name, labels)] = value
+
+def add_gauge(name: str, amount: float, labels: dict | None = None):
+    key = _key(name, labels)
+    _gauges[key] = _gauges.get(key, 0) + amount
+
+def latency(name: str, labels: dict | None = None) -> LatencyStat:
+    key = _key(name, labels)
+    stat = _latencies.get(key)
+    if stat is None:
+        stat = _latencies[key] = LatencyStat()
+    return stat
+
+def observe(name: str, seconds: float, labels: dict | None = None):
+    latency(name, labels).observe(seconds)
+
+# fn() -> iterable of (name, value, labels) gauges sampled at scrape time
+def register_collector(fn):
+    _collectors.append(fn)
+
+def _label_str(labels: tuple, extra: tuple = ()):
+    items = labels + extra
+    if not items:
+        return ''
+    pairs = (
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in items
+    )
+    return '{' + ','.join(pairs) + '}'
+
+def _format(value: float):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _grouped(items):
+    groups: dict[str, list] = {}
+    for (name, labels), value in items:
+        groups.setdefault(name, []).append((labels, value))
+    return sorted(groups.items())
+
+def render_prometheus():
+    gauges = dict(_gauges)
+    for collector in _collectors:
+        try:
+            for name, value, labels in collector():
+                gauges[_key(name, labels)] = value
+        except Exception:
+            incr('metrics_collector_errors')
+
+    lines = []
+    for name, series in _grouped(_counters.items()):
+        metric = f'{PREFIX}{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        for labels, value in series:
+            lines.append(f'{metric}{_label_str(labels)} {_format(value)}')
+    for name, series in _grouped(gauges.items()):
+        metric = f'{PREFIX}{name}'
+        lines.append(f'# TYPE {metric} gauge')
+        for labels, value in series:
+            lines.append(f'{metric}{_label_str(labels)} {_format(value)}')
+    for name, series in _grouped(_latencies.items()):
+        metric = f'{PREFIX}{name}_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        for labels, stat in series:
+            cumulative = 0
+            for bound, count in zip(stat.buckets + (float('inf'),), stat.bucket_counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_label_str(labels, (("le", _format(bound)),))} {cumulative}')
+            lines.append(f'{metric}_sum{_label_str(labels)} {_format(stat.total)}')
+            lines.append(f'{metric}_count{_label_str(labels)} {stat.count}')
+    return '\n'.join(lines) + '\n'
+
+def snapshot():
+    def flat(key):
+        name, labels = key
+        return name + _label_str(labels)
+
+    return {
+        "counters": {flat(k): v for k, v in _counters.items()},
+        "gauges": {flat(k): v for k, v in _gauges.items()},
+        "latencies": {flat(k): stat.snapshot() for k, stat in _latencies.items()},
+    }
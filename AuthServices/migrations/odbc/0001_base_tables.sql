@@ -0,0 +1,26 @@
+-- Users and tokensReset as the service has always used them; a no-op on
+-- databases that already have them
+IF OBJECT_ID(N'dbo.Users', N'U') IS NULL
+CREATE TABLE dbo.Users (
+    UserID INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+    UserPassword NVARCHAR(255) NOT NULL,
+    Email NVARCHAR(255) NULL,
+    UserRole NVARCHAR(50) NULL,
+    isDisabled BIT NOT NULL DEFAULT 0,
+    CreatedAt DATETIME2 NULL,
+    System NVARCHAR(10) NULL,
+    Username NVARCHAR(100) NULL,
+    PhoneNumber NVARCHAR(20) NULL,
+    FirstName NVARCHAR(100) NULL,
+    MiddleName NVARCHAR(100) NULL,
+    LastName NVARCHAR(100) NULL,
+    Suffix NVARCHAR(20) NULL
+);
+GO
+IF OBJECT_ID(N'dbo.tokensReset', N'U') IS NULL
+CREATE TABLE dbo.tokensReset (
+    id INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+    email NVARCHAR(255) NOT NULL,
+    token NVARCHAR(255) NOT NULL,
+    expires_at DATETIME NOT NULL
+);
@@ -0,0 +1,20 @@
+IF OBJECT_ID(N'dbo.refreshTokens', N'U') IS NULL
+CREATE TABLE dbo.refreshTokens (
+    TokenHash CHAR(64) NOT NULL PRIMARY KEY,
+    FamilyID CHAR(32) NOT NULL,
+    Username NVARCHAR(100) NOT NULL,
+    System NVARCHAR(10) NOT NULL,
+    CreatedAt DATETIME2 NOT NULL,
+    ExpiresAt DATETIME2 NOT NULL,
+    UsedAt DATETIME2 NULL,
+    RevokedAt DATETIME2 NULL
+);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_refreshTokens_Family' AND object_id = OBJECT_ID(N'dbo.refreshTokens'))
+CREATE INDEX IX_refreshTokens_Family ON dbo.refreshTokens (FamilyID);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_refreshTokens_User' AND object_id = OBJECT_ID(N'dbo.refreshTokens'))
+CREATE INDEX IX_refreshTokens_User ON dbo.refreshTokens (Username, System) INCLUDE (RevokedAt);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_refreshTokens_ExpiresAt' AND object_id = OBJECT_ID(N'dbo.refreshTokens'))
+CREATE INDEX IX_refreshTokens_ExpiresAt ON dbo.refreshTokens (ExpiresAt);
@@ -0,0 +1,26 @@
+-- indexes for the per-request lookups. the unique ones fail if active
+-- duplicates already exist; disable the extra rows first.
+
+-- login: Username + isDisabled, covering the columns it reads
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'UX_Users_Username_System' AND object_id = OBJECT_ID(N'dbo.Users'))
+CREATE UNIQUE INDEX UX_Users_Username_System ON dbo.Users (Username, System)
+    INCLUDE (UserPassword, UserRole) WHERE isDisabled = 0;
+GO
+-- forgot/reset password: Email + System + UserRole
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'UX_Users_Email_System' AND object_id = OBJECT_ID(N'dbo.Users'))
+CREATE UNIQUE INDEX UX_Users_Email_System ON dbo.Users (Email, System)
+    INCLUDE (UserRole, Username) WHERE isDisabled = 0;
+GO
+-- list-users keyset pages sorted by createdAt / username
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Users_CreatedAt' AND object_id = OBJECT_ID(N'dbo.Users'))
+CREATE INDEX IX_Users_CreatedAt ON dbo.Users (CreatedAt, UserID);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Users_Username' AND object_id = OBJECT_ID(N'dbo.Users'))
+CREATE INDEX IX_Users_Username ON dbo.Users (Username, UserID);
+GO
+-- reset-password: (email, token), and the expiry sweeper
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_tokensReset_email_token' AND object_id = OBJECT_ID(N'dbo.tokensReset'))
+CREATE INDEX IX_tokensReset_email_token ON dbo.tokensReset (email, token) INCLUDE (expires_at);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_tokensReset_expires_at' AND object_id = OBJECT_ID(N'dbo.tokensReset'))
+CREATE INDEX IX_tokensReset_expires_at ON dbo.tokensReset (expires_at);
@@ -0,0 +1,26 @@
+-- append-only audit trail written in batches by auditlog.py. the service
+-- never updates or deletes rows; to enforce that, grant its login only
+-- INSERT and SELECT on this table.
+IF OBJECT_ID(N'dbo.auditLog', N'U') IS NULL
+CREATE TABLE dbo.auditLog (
+    AuditID BIGINT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+    OccurredAt DATETIME2 NOT NULL,
+    Action NVARCHAR(50) NOT NULL,
+    Outcome NVARCHAR(20) NOT NULL,
+    Actor NVARCHAR(100) NULL,
+    Target NVARCHAR(100) NULL,
+    System NVARCHAR(10) NULL,
+    ClientIP NVARCHAR(45) NULL,
+    RequestID NVARCHAR(64) NULL,
+    Detail NVARCHAR(MAX) NULL
+);
+GO
+-- query endpoint filters, newest first
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_auditLog_Target' AND object_id = OBJECT_ID(N'dbo.auditLog'))
+CREATE INDEX IX_auditLog_Target ON dbo.auditLog (Target, AuditID);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_auditLog_Actor' AND object_id = OBJECT_ID(N'dbo.auditLog'))
+CREATE INDEX IX_auditLog_Actor ON dbo.auditLog (Actor, AuditID);
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_auditLog_OccurredAt' AND object_id = OBJECT_ID(N'dbo.auditLog'))
+CREATE INDEX IX_auditLog_OccurredAt ON dbo.auditLog (OccurredAt, AuditID);
@@ -0,0 +1,4 @@
+-- list-users sorts createdAt by UserID (identity order), so nothing reads
+-- IX_Users_CreatedAt; drop it rather than maintain it on every insert
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Users_CreatedAt' AND object_id = OBJECT_ID(N'dbo.Users'))
+DROP INDEX IX_Users_CreatedAt ON dbo.Users;
@@ -0,0 +1,10 @@
+-- token version per principal, so revoking outstanding access tokens survives
+-- a restart. keyed by name rather than UserID: a renamed or moved account
+-- leaves no Users row under the old principal
+IF OBJECT_ID(N'dbo.tokenVersions', N'U') IS NULL
+CREATE TABLE dbo.tokenVersions (
+    Username NVARCHAR(100) NOT NULL,
+    System NVARCHAR(10) NOT NULL,
+    Version INT NOT NULL,
+    CONSTRAINT PK_tokenVersions PRIMARY KEY (Username, System)
+);
@@ -0,0 +1,23 @@
+-- Users and tokensReset as the service has always used them
+CREATE TABLE IF NOT EXISTS Users (
+    UserID INTEGER PRIMARY KEY AUTOINCREMENT,
+    UserPassword TEXT NOT NULL,
+    Email TEXT,
+    UserRole TEXT,
+    isDisabled INTEGER NOT NULL DEFAULT 0,
+    CreatedAt TIMESTAMP,
+    System TEXT,
+    Username TEXT,
+    PhoneNumber TEXT,
+    FirstName TEXT,
+    MiddleName TEXT,
+    LastName TEXT,
+    Suffix TEXT
+);
+GO
+CREATE TABLE IF NOT EXISTS tokensReset (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    token TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
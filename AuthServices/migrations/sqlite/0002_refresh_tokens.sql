@@ -0,0 +1,16 @@
+CREATE TABLE IF NOT EXISTS refreshTokens (
+    TokenHash TEXT NOT NULL PRIMARY KEY,
+    FamilyID TEXT NOT NULL,
+    Username TEXT NOT NULL,
+    System TEXT NOT NULL,
+    CreatedAt TIMESTAMP NOT NULL,
+    ExpiresAt TIMESTAMP NOT NULL,
+    UsedAt TIMESTAMP,
+    RevokedAt TIMESTAMP
+);
+GO
+CREATE INDEX IF NOT EXISTS IX_refreshTokens_Family ON refreshTokens (FamilyID);
+GO
+CREATE INDEX IF NOT EXISTS IX_refreshTokens_User ON refreshTokens (Username, System);
+GO
+CREATE INDEX IF NOT EXISTS IX_refreshTokens_ExpiresAt ON refreshTokens (ExpiresAt);
@@ -0,0 +1,12 @@
+-- same indexes as the SQL Server migration, without INCLUDE columns
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Users_Username_System ON Users (Username, System) WHERE isDisabled = 0;
+GO
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Users_Email_System ON Users (Email, System) WHERE isDisabled = 0;
+GO
+CREATE INDEX IF NOT EXISTS IX_Users_CreatedAt ON Users (CreatedAt, UserID);
+GO
+CREATE INDEX IF NOT EXISTS IX_Users_Username ON Users (Username, UserID);
+GO
+CREATE INDEX IF NOT EXISTS IX_tokensReset_email_token ON tokensReset (email, token);
+GO
+CREATE INDEX IF NOT EXISTS IX_tokensReset_expires_at ON tokensReset (expires_at);
@@ -0,0 +1,19 @@
+-- append-only audit trail written in batches by auditlog.py
+CREATE TABLE IF NOT EXISTS auditLog (
+    AuditID INTEGER PRIMARY KEY AUTOINCREMENT,
+    OccurredAt TIMESTAMP NOT NULL,
+    Action TEXT NOT NULL,
+    Outcome TEXT NOT NULL,
+    Actor TEXT,
+    Target TEXT,
+    System TEXT,
+    ClientIP TEXT,
+    RequestID TEXT,
+    Detail TEXT
+);
+GO
+CREATE INDEX IF NOT EXISTS IX_auditLog_Target ON auditLog (Target, AuditID);
+GO
+CREATE INDEX IF NOT EXISTS IX_auditLog_Actor ON auditLog (Actor, AuditID);
+GO
+CREATE INDEX IF NOT EXISTS IX_auditLog_OccurredAt ON auditLog (OccurredAt, AuditID);
@@ -0,0 +1,2 @@
+-- list-users sorts createdAt by UserID, so nothing reads IX_Users_CreatedAt
+DROP INDEX IF EXISTS IX_Users_CreatedAt;
@@ -0,0 +1,9 @@
+-- token version per principal, so revoking outstanding access tokens survives
+-- a restart. keyed by name rather than UserID: a renamed or moved account
+-- leaves no Users row under the old principal
+CREATE TABLE IF NOT EXISTS tokenVersions (
+    Username TEXT NOT NULL,
+    System TEXT NOT NULL,
+    Version INTEGER NOT NULL,
+    PRIMARY KEY (Username, System)
+);
@@ -0,0 +1,120 @@
+# allowed CORS origins
+#
+# read from CORS_CONFIG (default cors.json next to this file): a registry of
+# services and their browser origins, glob patterns for LAN ranges and the
+# preflight max age. in a pattern `*` stands for one host label, octet or
+# port, e.g. "http://192.168.100.*:4001". CORS_ORIGINS and
+# CORS_ORIGIN_PATTERNS (comma separated) add to the file. the file is
+# re-read when it changes, checked at most every CORS_RELOAD_SECONDS; a file
+# that fails to parse keeps the previous registry.
+import json
+import os
+import re
+import time
+from starlette.middleware.cors import CORSMiddleware
+import applog
+import metrics
+
+logger = applog.get_logger("origins")
+
+CORS_CONFIG = os.getenv("CORS_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cors.json"))
+CORS_ORIGINS = os.getenv("CORS_ORIGINS", "")
+CORS_ORIGIN_PATTERNS = os.getenv("CORS_ORIGIN_PATTERNS", "")
+CORS_RELOAD_SECONDS = float(os.getenv("CORS_RELOAD_SECONDS", 5))
+# browsers cap this (chrome at 2h), so larger values buy little
+CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", 7200))
+
+
+def _split(value: str):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def compile_patterns(patterns):
+    if not patterns:
+        return None
+    parts = (re.escape(p).replace(r"\*", r"[A-Za-z0-9-]+") for p in patterns)
+    return re.compile("|".join(f"(?:{part})" for part in parts))
+
+
+class OriginRegistry:
+    def __init__(self, path: str = CORS_CONFIG, reload_seconds: float = CORS_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.services: dict[str, list[str]] = {}
+        self.origins: frozenset = frozenset()
+        self.patterns: list[str] = []
+        self.max_age = CORS_MAX_AGE
+        self._regex = None
+        self._mtime = None
+        self._checked = 0.0
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime, config = None, {}
+        else:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    config = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Keeping previous CORS registry", extra={"path": self.path, "error": str(e)})
+                self._mtime = mtime
+                return False
+
+        services = {name: list(origins) for name, origins in config.get("services", {}).items()}
+        origins = {o for service_origins in services.values() for o in service_origins} | set(_split(CORS_ORIGINS))
+        patterns = list(config.get("patterns", [])) + _split(CORS_ORIGIN_PATTERNS)
+
+        self.services = services
+        self.origins = frozenset(o.rstrip("/") for o in origins)
+        self.patterns = patterns
+        self._regex = compile_patterns(patterns)
+        self.max_age = int(config.get("max_age", CORS_MAX_AGE))
+        self._mtime = mtime
+        metrics.incr("cors_registry_reloads")
+        logger.info("Loaded CORS registry", extra={"origins": len(self.origins), "patterns": len(patterns)})
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_seconds:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def is_allowed(self, origin: str):
+        self._maybe_reload()
+        if origin in self.origins:
+            return True
+        return self._regex is not None and self._regex.fullmatch(origin) is not None
+
+
+registry = OriginRegistry()
+
+
+# starlette's CORS handling with origins and max age from the registry, and
+# counters for how much of the traffic is preflights
+class RegistryCORSMiddleware(CORSMiddleware):
+    def __init__(self, app, registry: OriginRegistry = registry, **kwargs):
+        super().__init__(app, max_age=registry.max_age, **kwargs)
+        self.registry = registry
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        return self.registry.is_allowed(origin)
+
+    def preflight_response(self, request_headers):
+        response = super().preflight_response(request_headers)
+        response.headers["Access-Control-Max-Age"] = str(self.registry.max_age)
+        metrics.incr("cors_requests", labels={"kind": "preflight", "allowed": str(response.status_code == 200).lower()})
+        return response
+
+    async def simple_response(self, scope, receive, send, request_headers):
+        allowed = self.is_allowed_origin(request_headers["origin"])
+        metrics.incr("cors_requests", labels={"kind": "simple", "allowed": str(allowed).lower()})
+        await super().simple_response(scope, receive, send, request_headers)
@@ -0,0 +1,195 @@
+# opaque, rotating refresh tokens
+#
+# the client only ever holds the raw token; the db stores an HMAC-SHA256 of
+# it (fast to check, useless if the table leaks). every refresh marks the
+# presented token used and issues a new one in the same family. presenting
+# a used token again means it was copied, so the whole family is revoked.
+#
+# table and indexes: migrations/<backend>/0002_refresh_tokens.sql
+import hashlib
+import hmac
+import os
+import re
+import secrets
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import get_db_connection, transaction
+import signing
+
+load_dotenv()
+
+REFRESH_TOKEN_DEFAULT_LIFETIME = os.getenv("REFRESH_TOKEN_DEFAULT_LIFETIME", "7d")
+# per-system overrides, e.g. "POS=12h,IMS=1d,OOS=30d"
+REFRESH_TOKEN_LIFETIMES = os.getenv("REFRESH_TOKEN_LIFETIMES", "POS=12h,IMS=1d,OOS=30d")
+REFRESH_TOKEN_HMAC_KEY = os.getenv("REFRESH_TOKEN_HMAC_KEY")
+
+
+ROTATE_SQL = '''
+    SELECT r.FamilyID, r.Username, r.System, r.ExpiresAt, r.UsedAt, r.RevokedAt, u.UserRole
+    FROM refreshTokens r
+    LEFT JOIN Users u ON u.Username = r.Username AND u.System = r.System AND u.isDisabled = 0
+    WHERE r.TokenHash = ?
+'''
+REVOKE_USER_SQL = "UPDATE refreshTokens SET RevokedAt = ? WHERE Username = ? AND System = ? AND RevokedAt IS NULL"
+
+
+class RefreshTokenError(Exception):
+    pass
+
+
+class _ReuseDetected(Exception):
+    def __init__(self, family_id: str):
+        self.family_id = family_id
+
+
+def _parse_lifetime(value: str):
+    match = re.fullmatch(r"\s*(\d+)\s*([mhd])\s*", value)
+    if not match:
+        raise ValueError(f"Invalid refresh token lifetime: {value!r}")
+    amount, unit = int(match.group(1)), match.group(2)
+    return {"m": timedelta(minutes=amount), "h": timedelta(hours=amount), "d": timedelta(days=amount)}[unit]
+
+_default_lifetime = _parse_lifetime(REFRESH_TOKEN_DEFAULT_LIFETIME)
+_lifetimes = {
+    system.strip(): _parse_lifetime(lifetime)
+    for system, lifetime in (item.split("=", 1) for item in REFRESH_TOKEN_LIFETIMES.split(",") if item.strip())
+}
+
+def lifetime_for(system: str):
+    return _lifetimes.get(system, _default_lifetime)
+
+_hmac_key: bytes | None = None
+# hex chars written by _create_hmac_key; anything shorter is a bad file
+_HMAC_KEY_MIN_LENGTH = 64
+
+# write the key file once, atomically: a fully written temp file is linked
+# into place, and a process that loses the race just uses the winner's key
+def _create_hmac_key(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+
+# key from env, else a random one kept next to the signing keys
+def _get_hmac_key():
+    global _hmac_key
+    if _hmac_key is None:
+        if REFRESH_TOKEN_HMAC_KEY:
+            _hmac_key = REFRESH_TOKEN_HMAC_KEY.encode("utf-8")
+        else:
+            path = os.path.join(signing.JWT_KEYS_DIR, "refresh-hmac.key")
+            if not os.path.exists(path):
+                _create_hmac_key(path)
+            with open(path) as f:
+                key = f.read().strip()
+            if len(key) < _HMAC_KEY_MIN_LENGTH:
+                raise RuntimeError(f"Refresh token HMAC key in {path} is too short; delete it to generate a new one")
+            _hmac_key = key.encode("utf-8")
+    return _hmac_key
+
+# create the key before workers start, so they all read the same one
+def ensure_hmac_key():
+    _get_hmac_key()
+
+def hash_token(token: str):
+    return hmac.new(_get_hmac_key(), token.encode("utf-8"), hashlib.sha256).hexdigest()
+
+async def _insert(cursor, family_id: str, username: str, system: str, now: datetime):
+    token = secrets.token_urlsafe(32)
+    await cursor.execute(
+        "INSERT INTO refreshTokens (TokenHash, FamilyID, Username, System, CreatedAt, ExpiresAt) VALUES (?, ?, ?, ?, ?, ?)",
+        (hash_token(token), family_id, username, system, now, now + lifetime_for(system))
+    )
+    return token
+
+# new family at login
+async def issue(username: str, system: str):
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        token = await _insert(cursor, secrets.token_hex(16), username, system, datetime.utcnow())
+        await conn.commit()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+    return token
+
+# swap a refresh token for a new one; returns (new token, username, system, role)
+async def rotate(token: str):
+    token_hash = hash_token(token)
+    now = datetime.utcnow()
+    conn = await get_db_connection()
+    try:
+        async with transaction(conn) as cursor:
+            await cursor.execute(ROTATE_SQL, (token_hash,))
+            row = await cursor.fetchone()
+            if not row:
+                raise RefreshTokenError("Invalid refresh token")
+            family_id, username, system, expires_at, used_at, revoked_at, role = row
+            if revoked_at is not None:
+                raise RefreshTokenError("Refresh token revoked")
+            if used_at is not None:
+                raise _ReuseDetected(family_id)
+            if isinstance(expires_at, str):
+                expires_at = datetime.fromisoformat(expires_at)
+            if expires_at < now or role is None:
+                raise RefreshTokenError("Refresh token expired")
+
+            # guard against a concurrent refresh of the same token
+            await cursor.execute(
+                "UPDATE refreshTokens SET UsedAt = ? WHERE TokenHash = ? AND UsedAt IS NULL",
+                (now, token_hash)
+            )
+            if cursor.rowcount != 1:
+                raise RefreshTokenError("Refresh token already used")
+            new_token = await _insert(cursor, family_id, username, system, now)
+    except _ReuseDetected as e:
+        cursor = await conn.cursor()
+        try:
+            await cursor.execute(
+                "UPDATE refreshTokens SET RevokedAt = ? WHERE FamilyID = ? AND RevokedAt IS NULL",
+                (now, e.family_id)
+            )
+            await conn.commit()
+        finally:
+            await cursor.close()
+        raise RefreshTokenError("Refresh token reuse detected")
+    finally:
+        await conn.close()
+    return new_token, username, system, role
+
+# logout — revoke the family the token belongs to
+async def revoke_family(token: str):
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute('''
+            UPDATE refreshTokens SET RevokedAt = ?
+            WHERE RevokedAt IS NULL AND FamilyID = (SELECT FamilyID FROM refreshTokens WHERE TokenHash = ?)
+        ''', (datetime.utcnow(), hash_token(token)))
+        await conn.commit()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+
+# revoke every family of a principal, on the caller's cursor/connection
+async def revoke_user(cursor, username: str, system: str):
+    await cursor.execute(REVOKE_USER_SQL, (datetime.utcnow(), username, system))
+
+# revoke_user for many (username, system) pairs, as one executemany
+async def revoke_users(cursor, principals):
+    now = datetime.utcnow()
+    params = [(now, username, system) for username, system in principals]
+    if params:
+        await cursor.executemany(REVOKE_USER_SQL, params)
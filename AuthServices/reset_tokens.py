@@ -0,0 +1,162 @@
+# password reset tokens
+#
+# only a sha-256 of each token is stored (tokens are random, so no key or
+# slow hash is needed). issuing a token replaces any older ones for the same
+# email, and a background sweeper deletes expired rows in small batches.
+#
+# indexes: migrations/<backend>/0003_lookup_indexes.sql
+import asyncio
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import get_db_connection, transaction
+import applog
+import refresh_tokens
+import revocation
+
+load_dotenv()
+
+logger = applog.get_logger("reset_tokens")
+
+RESET_TOKEN_EXP_MINUTES = int(os.getenv("RESET_TOKEN_EXP_MINUTES", 15))
+RESET_SWEEP_INTERVAL_SECONDS = float(os.getenv("RESET_SWEEP_INTERVAL_SECONDS", 300))
+RESET_SWEEP_BATCH_SIZE = int(os.getenv("RESET_SWEEP_BATCH_SIZE", 1000))
+
+
+class _TokenGone(Exception):
+    pass
+
+
+CHECK_SQL = "SELECT expires_at FROM tokensReset WHERE email = ? AND token = ?"
+SWEEP_WHERE = "expires_at < ?"
+
+def hash_token(token: str):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+# store a fresh token for email, invalidating older ones; returns the raw token
+async def issue(email: str):
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(minutes=RESET_TOKEN_EXP_MINUTES)
+    conn = await get_db_connection()
+    try:
+        async with transaction(conn) as cursor:
+            await cursor.execute("DELETE FROM tokensReset WHERE email = ?", (email,))
+            await cursor.execute(
+                "INSERT INTO tokensReset (email, token, expires_at) VALUES (?, ?, ?)",
+                (email, hash_token(token), expires_at)
+            )
+    finally:
+        await conn.close()
+    return token
+
+# 'valid', 'expired' or 'invalid'; expired tokens are deleted on sight
+async def check(email: str, token: str):
+    token_hash = hash_token(token)
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute(CHECK_SQL, (email, token_hash))
+        row = await cursor.fetchone()
+        if not row:
+            return 'invalid'
+        if datetime.utcnow() > row[0]:
+            await cursor.execute("DELETE FROM tokensReset WHERE email = ? AND token = ?", (email, token_hash))
+            await conn.commit()
+            return 'expired'
+        return 'valid'
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+
+# consume the token and set the new password in one transaction; returns
+# {(username, 'OOS'): token version} for the affected accounts, or None if
+# the token was already used or expired
+async def redeem(email: str, token: str, hashed_password: str):
+    conn = await get_db_connection()
+    try:
+        async with transaction(conn) as cursor:
+            await cursor.execute(
+                "DELETE FROM tokensReset WHERE email = ? AND token = ? AND expires_at > ?",
+                (email, hash_token(token), datetime.utcnow())
+            )
+            if cursor.rowcount != 1:
+                raise _TokenGone()
+            await cursor.execute(
+                "SELECT Username FROM Users WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
+                (email,)
+            )
+            usernames = [r[0] for r in await cursor.fetchall()]
+            await cursor.execute(
+                "UPDATE Users SET UserPassword = ? WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
+                (hashed_password, email)
+            )
+            for username in usernames:
+                await refresh_tokens.revoke_user(cursor, username, 'OOS')
+            versions = await revocation.persist_bumps(conn, cursor, [(username, 'OOS') for username in usernames])
+            # rows issued before tokens were replaced on issue
+            await cursor.execute("DELETE FROM tokensReset WHERE email = ?", (email,))
+    except _TokenGone:
+        return None
+    finally:
+        await conn.close()
+    return versions
+
+
+async def _delete_in_batches(conn, table: str, where: str, params: tuple):
+    deleted = 0
+    cursor = await conn.cursor()
+    try:
+        sql = conn.backend.delete_limit_sql(table, where, RESET_SWEEP_BATCH_SIZE)
+        while True:
+            await cursor.execute(sql, params)
+            await conn.commit()
+            deleted += max(cursor.rowcount, 0)
+            if cursor.rowcount < RESET_SWEEP_BATCH_SIZE:
+                return deleted
+            # let request traffic in between batches
+            await asyncio.sleep(0)
+    finally:
+        await cursor.close()
+
+# delete expired reset and refresh tokens
+async def sweep_expired():
+    conn = await get_db_connection()
+    try:
+        resets = await _delete_in_batches(conn, "tokensReset", SWEEP_WHERE, (datetime.utcnow(),))
+        refreshes = await _delete_in_batches(conn, "refreshTokens", "ExpiresAt < ?", (datetime.utcnow(),))
+    finally:
+        await conn.close()
+    if resets or refreshes:
+        logger.info("Swept expired tokens", extra={"reset_tokens": resets, "refresh_tokens": refreshes})
+    return resets, refreshes
+
+_sweeper: asyncio.Task | None = None
+
+async def _sweep_forever():
+    while True:
+        try:
+            await sweep_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error sweeping expired tokens")
+        await asyncio.sleep(RESET_SWEEP_INTERVAL_SECONDS)
+
+def start_sweeper():
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.create_task(_sweep_forever())
+
+async def stop_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
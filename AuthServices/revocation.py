@@ -0,0 +1,122 @@
+# token revocation, keyed by (username, system)
+#
+# every access token carries the principal's token version ("ver"); bumping
+# the version rejects all tokens issued before it. disabled principals are
+# rejected outright. both are checked in memory: versions are persisted in
+# tokenVersions by the write path's own transaction (persist_bumps) and
+# loaded at startup, disabled principals are loaded from Users in stateless
+# mode. one entry per principal whose credentials changed or who was
+# disabled. with several workers, changes are published to the others (see
+# invalidation.py).
+import invalidation
+from database import get_db_connection
+
+_versions: dict[tuple[str, str], int] = {}
+_disabled: set[tuple[str, str]] = set()
+
+
+def token_version(username: str, system: str) -> int:
+    return _versions.get((username, system), 0)
+
+def _raise_version(key, version: int):
+    # versions only move forward, so concurrent bumps on two workers converge
+    if version > _versions.get(key, 0):
+        _versions[key] = version
+
+# bump the stored version of each (username, system) in the caller's
+# transaction; returns {(username, system): new version}, applied with
+# bump_version()/mark_disabled() once it commits
+async def persist_bumps(conn, cursor, principals):
+    principals = list(dict.fromkeys(principals))
+    if not principals:
+        return {}
+    await cursor.executemany(f'''
+        INSERT INTO tokenVersions (Username, System, Version)
+        SELECT ?, ?, 0
+        WHERE NOT EXISTS (SELECT 1 FROM {conn.backend.locked('tokenVersions')} WHERE Username = ? AND System = ?)
+    ''', [(username, system, username, system) for username, system in principals])
+    await cursor.executemany(
+        "UPDATE tokenVersions SET Version = Version + 1 WHERE Username = ? AND System = ?", principals
+    )
+    versions = {}
+    for key in principals:
+        await cursor.execute("SELECT Version FROM tokenVersions WHERE Username = ? AND System = ?", key)
+        versions[key] = (await cursor.fetchone())[0]
+    return versions
+
+def bump_version(username: str, system: str, version: int):
+    _raise_version((username, system), version)
+    invalidation.publish("revocation", op="version", username=username, system=system, version=version)
+
+def mark_disabled(username: str, system: str, version: int):
+    _disabled.add((username, system))
+    _raise_version((username, system), version)
+    invalidation.publish("revocation", op="disable", username=username, system=system, version=version)
+
+def mark_enabled(username: str, system: str):
+    _disabled.discard((username, system))
+    invalidation.publish("revocation", op="enable", username=username, system=system)
+
+# the same for many principals, published once
+def mark_enabled_many(principals):
+    principals = list(principals)
+    _disabled.difference_update(principals)
+    for i in range(0, len(principals), 500):
+        invalidation.publish("revocation", op="enable_many", principals=principals[i:i + 500])
+
+def is_revoked(username: str, system: str | None, version: int | None) -> bool:
+    key = (username, system)
+    if key in _disabled:
+        return True
+    return (version or 0) < _versions.get(key, 0)
+
+# seed disabled principals so a restart doesn't re-admit them
+async def load_disabled():
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute('''
+            SELECT DISTINCT d.Username, d.System FROM Users d
+            WHERE d.isDisabled = 1 AND NOT EXISTS (
+                SELECT 1 FROM Users a WHERE a.Username = d.Username AND a.System = d.System AND a.isDisabled = 0
+            )
+        ''')
+        rows = await cursor.fetchall()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+    _disabled.update((row[0], row[1]) for row in rows)
+    return len(rows)
+
+# seed the stored versions so a restart doesn't re-admit revoked tokens
+async def load_versions():
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute("SELECT Username, System, Version FROM tokenVersions")
+        rows = await cursor.fetchall()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+    for username, system, version in rows:
+        _raise_version((username, system), version)
+    return len(rows)
+
+# the same changes, made on another worker
+def _apply_remote(event: dict):
+    if event["op"] == "enable_many":
+        _disabled.difference_update(tuple(p) for p in event["principals"])
+        return
+    key = (event["username"], event["system"])
+    if event["op"] == "enable":
+        _disabled.discard(key)
+        return
+    if event["op"] == "disable":
+        _disabled.add(key)
+    _raise_version(key, event["version"])
+
+invalidation.subscribe("revocation", _apply_remote)
@@ -0,0 +1,98 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from datetime import datetime
+from database import get_db_connection
+from routers.auth import role_required
+import applog
+import auditlog
+import json
+import os
+from typing import Optional
+
+router = APIRouter()
+logger = applog.get_logger("audit")
+
+AUDIT_QUERY_DEFAULT_LIMIT = int(os.getenv('AUDIT_QUERY_DEFAULT_LIMIT', 100))
+AUDIT_QUERY_MAX_LIMIT = int(os.getenv('AUDIT_QUERY_MAX_LIMIT', 1000))
+
+def _event(row):
+    event = {'auditID': row[0]}
+    for name, value in zip(auditlog.COLUMNS, row[1:]):
+        key = name[0].lower() + name[1:]
+        if name == 'OccurredAt':
+            value = value.isoformat() if value else None
+        elif name == 'Detail':
+            value = json.loads(value) if value else None
+        event[key] = value
+    return event
+
+# sql and params for events matching filters ({column: value}), newest first
+def events_query(filters: dict, since=None, until=None, cursor=None):
+    where = []
+    params = []
+    for column, value in filters.items():
+        if value is not None:
+            where.append(f'{column} = ?')
+            params.append(value)
+    if since is not None:
+        where.append('OccurredAt >= ?')
+        params.append(since)
+    if until is not None:
+        where.append('OccurredAt < ?')
+        params.append(until)
+    if cursor is not None:
+        where.append('AuditID < ?')
+        params.append(cursor)
+
+    sql = f"SELECT AuditID, {', '.join(auditlog.COLUMNS)} FROM auditLog"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY AuditID DESC'
+    return sql, params
+
+# audit events, newest first, in keyset pages (next page in X-Next-Cursor).
+# events reach the table within AUDIT_FLUSH_SECONDS of happening.
+@router.get('/events', dependencies=[Depends(role_required(['superadmin']))])
+async def list_audit_events(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=AUDIT_QUERY_MAX_LIMIT),
+    cursor: Optional[int] = Query(None, description="AuditID to continue below"),
+    action: Optional[str] = None,
+    outcome: Optional[str] = None,
+    actor: Optional[str] = None,
+    target: Optional[str] = None,
+    system: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    if auditlog.AUDIT_SINK != 'db':
+        raise HTTPException(status_code=501, detail="Audit events are written to a file; query them there.")
+
+    sql, params = events_query(
+        {'Action': action, 'Outcome': outcome, 'Actor': actor, 'Target': target, 'System': system}, since, until, cursor
+    )
+
+    limit = limit or AUDIT_QUERY_DEFAULT_LIMIT
+    conn = None
+    db_cursor = None
+    try:
+        conn = await get_db_connection()
+        db_cursor = await conn.cursor()
+        # one extra row tells us whether there is a next page
+        await db_cursor.execute(conn.backend.limit_sql(sql, limit + 1), tuple(params))
+        rows = await db_cursor.fetchall()
+    except Exception:
+        logger.exception("Error in list_audit_events")
+        raise HTTPException(status_code=500, detail="Failed to retrieve audit events.")
+    finally:
+        if db_cursor: await db_cursor.close()
+        if conn: await conn.close()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1][0])
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+
+    return [_event(row) for row in rows]
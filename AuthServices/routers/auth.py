@@ -1,25 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-import aioodbc
+from jose import JWTError
 from database import get_db_connection  
+import applog
+import auditlog
+import hashing
+import invalidation
+import mailer
+import metrics
+import refresh_tokens
+import reset_tokens
+import revocation
+import signing
+import throttle
+import userdata
+from cache import TTLCache
+import asyncio
+import base64
+import hmac
+import time
+import math
 import os
-import uuid
-from fastapi import BackgroundTasks
-from email.message import EmailMessage
 from dotenv import load_dotenv
 from pydantic import EmailStr
-from typing import List
+from typing import List, Optional
 
 load_dotenv()
 
-# jwt config
-SECRET_KEY = "15882913506880857248f72d1dbc38dd7d2f8f352786563ef5f23dc60987c632"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+logger = applog.get_logger("auth")
+
+# jwt config — signing keys and algorithm live in signing.py
+ACCESS_TOKEN_EXPIRE_MINUTES = signing.ACCESS_TOKEN_EXPIRE_MINUTES
+# trust role/system claims instead of loading the Users row per request
+STATELESS_AUTH = os.getenv("STATELESS_AUTH", "false").lower() in ("1", "true", "yes")
+
+# active Users rows, keyed by username
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+
+# OAuth2 client_id -> system, for login clients that don't send `system`,
+# e.g. "pos-terminal=POS,oos-web=OOS"
+LOGIN_CLIENT_SYSTEMS = {
+    client.strip(): system.strip().upper()
+    for client, _, system in (pair.partition('=') for pair in os.getenv("LOGIN_CLIENT_SYSTEMS", "").split(','))
+    if client.strip() and system.strip()
+}
+
+# max tokens per /introspect call
+INTROSPECT_MAX_TOKENS = int(os.getenv("INTROSPECT_MAX_TOKENS", 100))
 
 router = APIRouter()
 
@@ -27,6 +58,7 @@ router = APIRouter()
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 class TokenData(BaseModel):
     username: str | None = None
@@ -41,43 +73,72 @@ class UserInDB(User):
     hashed_password: str
     system: str
 
-# hash password
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+class IntrospectRequest(BaseModel):
+    tokens: List[str]
 
-# email helper for forgor pass
-def send_reset_email(email_to: str, reset_link: str):
-    SMTP_SERVER = os.getenv("SMTP_SERVER")
-    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-    SMTP_USERNAME = os.getenv("SMTP_USERNAME")
-    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-    EMAIL_FROM = os.getenv("EMAIL_FROM")
+class TokenIntrospection(BaseModel):
+    active: bool
+    sub: str | None = None
+    role: str | None = None
+    system: str | None = None
+    exp: int | None = None
 
-    msg = EmailMessage()
-    msg['Subject'] = "Password Reset Request"
-    msg['From'] = EMAIL_FROM
-    msg['To'] = email_to
-    msg.set_content(f"Please click the following link to reset your password:\n\n{reset_link}\n\nIf you did not request this, please ignore this email.")
+class IntrospectResponse(BaseModel):
+    results: List[TokenIntrospection]
 
-    try:
-        import smtplib
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
-    except Exception as e:
-        print(f"Error sending email: {e}")
-
-# get users 
-async def get_users_from_db(username: str):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute(
-        '''SELECT Username, UserPassword, UserRole, isDisabled, System FROM Users WHERE Username = ? AND isDisabled = 0''',
-        (username,)
+principal_cache = TTLCache("principal", maxsize=PRINCIPAL_CACHE_MAX_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+# drop cached principals after their Users rows change, here and on the
+# other workers
+def invalidate_principal(*usernames: str):
+    usernames = [u for u in usernames if u]
+    principal_cache.invalidate(*usernames)
+    # every write to Users comes through here, so it also moves the version
+    userdata.bump()
+    # chunked so a bulk change stays within one datagram per message
+    for i in range(0, len(usernames), 500):
+        invalidation.publish("principal", usernames=usernames[i:i + 500])
+
+def _invalidate_remote(event: dict):
+    principal_cache.invalidate(*event["usernames"])
+    userdata.bump()
+
+invalidation.subscribe("principal", _invalidate_remote)
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+
+# email helper for forgor pass — queued, sent by the mailer workers
+# the link is useless once the token expires, so the mail is too
+async def send_reset_email(email_to: str, reset_link: str):
+    await mailer.enqueue(
+        email_to,
+        "Password Reset Request",
+        f"Please click the following link to reset your password:\n\n{reset_link}\n\nIf you did not request this, please ignore this email.",
+        expires_at=time.time() + reset_tokens.RESET_TOKEN_EXP_MINUTES * 60,
     )
-    user_rows = await cursor.fetchall()
-    await conn.close()
+
+# principal / login lookups (and schema.hot_queries)
+USERS_BY_USERNAME_SQL = '''SELECT Username, UserPassword, UserRole, isDisabled, System FROM Users WHERE Username = ? AND isDisabled = 0'''
+SYSTEM_SCOPE_SQL = ' AND System = ?'
+FORGOT_PASSWORD_SQL = "SELECT Username FROM Users WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0"
+
+# get users — every active row for username, or the one in system
+async def get_users_from_db(username: str, system: Optional[str] = None):
+    sql = USERS_BY_USERNAME_SQL
+    params = (username,)
+    if system:
+        sql += SYSTEM_SCOPE_SQL
+        params = (username, system)
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute(sql, params)
+        user_rows = await cursor.fetchall()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
 
     users = []
     for row in user_rows:
@@ -90,75 +151,143 @@ async def get_users_from_db(username: str):
         ))
     return users
 
-# hash pass
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
-
-# ensure admin exists on startup
-async def create_admin_user():
-    admin_user = await get_users_from_db('superadmin')
-    if not admin_user:
-        hashed_password = get_password_hash('superadmin123')
+# active (username, system) -> role for many usernames in one query
+async def get_active_principals(usernames: List[str]):
+    if not usernames:
+        return {}
+    placeholders = ', '.join('?' for _ in usernames)
+    conn = None
+    cursor = None
+    try:
         conn = await get_db_connection()
         cursor = await conn.cursor()
+        await cursor.execute(
+            f'''SELECT Username, System, UserRole FROM Users WHERE Username IN ({placeholders}) AND isDisabled = 0''',
+            tuple(usernames)
+        )
+        rows = await cursor.fetchall()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+    return {(row[0], row[1]): row[2] for row in rows}
+
+# background rehashes, kept referenced until they finish
+_rehash_tasks: set = set()
+
+# swap an outdated hash for one made with the current policy; skipped if
+# the password changed meanwhile or the hashing pool is busy
+async def rehash_password(user: UserInDB, password: str):
+    try:
+        new_hash = await hashing.hash_password(password)
+        conn = None
+        cursor = None
         try:
+            conn = await get_db_connection()
+            cursor = await conn.cursor()
             await cursor.execute(
-                '''INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (hashed_password, 'superadmin@example.com', 'superadmin' ,  0,  'AUTH', 'superadmin', '', 'Super', '', 'Admin', '',)
+                "UPDATE Users SET UserPassword = ? WHERE Username = ? AND System = ? AND UserPassword = ? AND isDisabled = 0",
+                (new_hash, user.username, user.system, user.hashed_password)
             )
-            await conn.commit()
-            print("Super Admin created.")
+            if cursor.rowcount == 1:
+                metrics.incr('password_rehashed')
         finally:
-            await cursor.close()
-            await conn.close()
-    else:
-        print("Super Admin already exists.")
-
-@router.on_event("startup")
-async def on_startup():
-    await create_admin_user()
-
-# verify password
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-# authenticate user
-async def authenticate_user(username: str, password: str):
-    users = await get_users_from_db(username)
+            if cursor: await cursor.close()
+            if conn: await conn.close()
+    except hashing.HashingBusyError:
+        pass
+    except Exception:
+        logger.exception("Error rehashing password", extra={"username": user.username})
+
+# authenticate user — with a system this verifies at most one hash
+async def authenticate_user(username: str, password: str, system: Optional[str] = None):
+    users = await get_users_from_db(username, system)
+    if not users:
+        # same cost as a real check, so timing doesn't reveal unknown usernames
+        await hashing.dummy_verify(password)
+        return None
     for user in users:
-        if verify_password(password, user.hashed_password):
+        ok, needs_update = await hashing.verify_password(password, user.hashed_password)
+        if ok:
+            if needs_update:
+                task = asyncio.create_task(rehash_password(user, password))
+                _rehash_tasks.add(task)
+                task.add_done_callback(_rehash_tasks.discard)
             return user
     return None
 
+# reject throttled attempts before any db or bcrypt work
+def enforce_throttle(request: Request, subject: str, scope: str):
+    retry_after = throttle.check(subject, client_ip(request), scope)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
+
+# access token for a resolved principal
+def issue_access_token(username: str, role: str, system: str):
+    return create_access_token(
+        data={
+            "sub": username,
+            "role": role,
+            "system": system,
+            "ver": revocation.token_version(username, system),
+        },
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
 # create jwt token
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return signing.encode_token(to_encode)
 
-# get current user from token
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credential_exception = HTTPException(
+def _credential_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"}
     )
+
+# claims of a well-formed, unexpired, unrevoked access token
+def verified_claims(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credential_exception
-        token_data = TokenData(username=username)
+        payload = signing.decode_token(token)
     except JWTError:
-        raise credential_exception
-
-    users = await get_users_from_db(token_data.username)
-    if not users:
-        raise credential_exception
+        raise _credential_exception()
+    username = payload.get("sub")
+    if username is None:
+        raise _credential_exception()
+    if revocation.is_revoked(username, payload.get("system"), payload.get("ver")):
+        raise _credential_exception()
+    return payload
+
+# the principal a verified token stands for
+async def principal_for(payload: dict):
+    username = payload["sub"]
+    # stateless mode — the signed claims are the principal, no db round-trip
+    if STATELESS_AUTH:
+        role, system = payload.get("role"), payload.get("system")
+        if role is None or system is None:
+            raise _credential_exception()
+        return User(username=username, userRole=role, system=system, disabled=False)
+
+    # cached per username (so invalidation stays by username), picked per system
+    users = await principal_cache.get_or_load(username, lambda: get_users_from_db(username))
+    token_system = payload.get("system")
+    user = next((u for u in users if token_system is None or u.system == token_system), None)
+    if user is None:
+        raise _credential_exception()
+    return user
 
-    return users[0]
+# get current user from token
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await principal_for(verified_claims(token))
 
 # validate active user
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)):
@@ -174,38 +303,158 @@ def role_required(required_roles: List[str]):
         return current_user
     return role_checker
 
-# get current user info
+# get current user info — conditional on the user data version, so a
+# client revalidating with If-None-Match gets a 304 without a principal lookup
 @router.get("/users/me", response_model=User)
-async def get_current_user_info(current_user: UserInDB = Depends(get_current_active_user)):
-    return {
-        "username": current_user.username,
-        "userRole": current_user.userRole,
-        "system": current_user.system, 
-        "disabled": current_user.disabled
-    }
+async def get_current_user_info(request: Request, token: str = Depends(oauth2_scheme)):
+    payload = verified_claims(token)
+    tag = userdata.etag("me", payload["sub"], payload.get("system"), payload.get("role"))
+    if userdata.not_modified(request.headers.get("if-none-match"), tag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=userdata.headers(tag))
+
+    current_user = await get_current_active_user(await principal_for(payload))
+    return JSONResponse(
+        {
+            "username": current_user.username,
+            "userRole": current_user.userRole,
+            "system": current_user.system,
+            "disabled": current_user.disabled
+        },
+        headers=userdata.headers(tag),
+    )
 
 # login endpoint — returns jwt token
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    print("Attempting to authenticate user:", form_data.username)
+async def login_for_access_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    system: Optional[str] = Form(None),
+):
+    # target system from the form, else from the OAuth2 client_id
+    system = (system or LOGIN_CLIENT_SYSTEMS.get(form_data.client_id or '') or '').upper() or None
+    logger.info("Attempting to authenticate user", extra={"username": form_data.username, "system": system})
+    try:
+        enforce_throttle(request, form_data.username, 'login')
+    except HTTPException:
+        auditlog.record('login', 'throttled', actor=form_data.username, target=form_data.username, system=system, client_ip=client_ip(request))
+        raise
+    if system is None:
+        metrics.incr('login_unscoped')
     
-    user = await authenticate_user(form_data.username, form_data.password)
+    started = time.perf_counter()
+    user = await authenticate_user(form_data.username, form_data.password, system)
+    metrics.observe('login_authenticate', time.perf_counter() - started)
     if not user:
-        print("Authentication failed for user:", form_data.username)
+        logger.info("Authentication failed", extra={"username": form_data.username})
+        throttle.record_failure(form_data.username, client_ip(request), 'login')
+        auditlog.record('login', 'failure', actor=form_data.username, target=form_data.username, system=system, client_ip=client_ip(request))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.userRole, "system": user.system},
-        expires_delta=access_token_expires
-    )
+    throttle.record_success(form_data.username, client_ip(request), 'login')
+    access_token = issue_access_token(user.username, user.userRole, user.system)
+    refresh_token = await refresh_tokens.issue(user.username, user.system)
     
-    print("Authentication successful for:", user.username)
-    return {"access_token": access_token, "token_type": "bearer"}
+    logger.info("Authentication successful", extra={"username": user.username, "system": user.system})
+    auditlog.record('login', actor=user.username, target=user.username, system=user.system, client_ip=client_ip(request))
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# swap a refresh token for a new access + refresh token, no password needed
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(refresh_token: str = Form(...)):
+    try:
+        new_refresh_token, username, system, role = await refresh_tokens.rotate(refresh_token)
+    except refresh_tokens.RefreshTokenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    access_token = issue_access_token(username, role, system)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
+
+# logout — revokes the refresh token's whole family
+@router.post("/logout")
+async def logout(refresh_token: str = Form(...)):
+    await refresh_tokens.revoke_family(refresh_token)
+    return {"message": "Logged out."}
+
+# public keys for local token verification (see jwt_verifier.py)
+@router.get("/.well-known/jwks.json")
+async def get_jwks(response: Response):
+    response.headers["Cache-Control"] = f"public, max-age={signing.JWKS_MAX_AGE_SECONDS}"
+    return signing.jwks()
+
+# callers of /introspect (RFC 7662 wants them authenticated): a client from
+# INTROSPECTION_CLIENTS ("id:secret,...") over HTTP Basic, or a bearer
+# token whose role is in INTROSPECTION_ROLES
+INTROSPECTION_CLIENTS = dict(
+    item.strip().split(":", 1) for item in os.getenv("INTROSPECTION_CLIENTS", "").split(",") if ":" in item
+)
+INTROSPECTION_ROLES = [r.strip() for r in os.getenv("INTROSPECTION_ROLES", "superadmin").split(",") if r.strip()]
+
+async def introspection_caller(request: Request):
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "basic":
+        try:
+            client_id, _, secret = base64.b64decode(credentials).decode("utf-8").partition(":")
+        except ValueError:
+            client_id, secret = None, ""
+        expected = INTROSPECTION_CLIENTS.get(client_id)
+        if expected is not None and hmac.compare_digest(expected.encode("utf-8"), secret.encode("utf-8")):
+            return client_id
+    elif scheme.lower() == "bearer" and credentials:
+        caller = await principal_for(verified_claims(credentials))
+        if caller.userRole not in INTROSPECTION_ROLES:
+            raise HTTPException(status_code=403, detail="Access denied")
+        return caller.username
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Introspection requires client credentials",
+        headers={"WWW-Authenticate": 'Basic realm="introspect", Bearer'}
+    )
+
+# batch token introspection for service-to-service checks
+@router.post("/introspect", response_model=IntrospectResponse, dependencies=[Depends(introspection_caller)])
+async def introspect_tokens(body: IntrospectRequest):
+    if len(body.tokens) > INTROSPECT_MAX_TOKENS:
+        raise HTTPException(status_code=413, detail=f"At most {INTROSPECT_MAX_TOKENS} tokens per request")
+
+    claims = []
+    for token in body.tokens:
+        try:
+            payload = signing.decode_token(token)
+        except JWTError:
+            payload = None
+        if payload is not None:
+            sub = payload.get("sub")
+            if sub is None or revocation.is_revoked(sub, payload.get("system"), payload.get("ver")):
+                payload = None
+        claims.append(payload)
+
+    # one query for every distinct subject
+    if STATELESS_AUTH:
+        active = {(p["sub"], p.get("system")): p.get("role") for p in claims if p}
+    else:
+        active = await get_active_principals(list({p["sub"] for p in claims if p}))
+
+    results = []
+    for payload in claims:
+        key = (payload["sub"], payload.get("system")) if payload else None
+        if key not in active:
+            results.append(TokenIntrospection(active=False))
+            continue
+        results.append(TokenIntrospection(
+            active=True,
+            sub=payload["sub"],
+            role=active[key],
+            system=payload.get("system"),
+            exp=payload.get("exp")
+        ))
+    return {"results": results}
 
 # admin-only test endpoint
 @router.get("/superadmin-only", dependencies=[Depends(role_required(["superadmin"]))])
@@ -214,67 +463,44 @@ async def admin_only_route():
 
 # forgor password
 @router.post("/forgot-password")
-async def forgot_password(email: EmailStr, background_tasks: BackgroundTasks):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute(
-        "SELECT Username FROM Users WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
-        (email,)
-    )
-    user = await cursor.fetchone()
+async def forgot_password(email: EmailStr):
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute(FORGOT_PASSWORD_SQL, (email,))
+        user = await cursor.fetchone()
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
     if not user:
-        await cursor.close()
-        await conn.close()
         return {"message": "If this email is registered, a reset link has been sent."}
 
-    # generate token and store in DB 
-    reset_token = str(uuid.uuid4())
-    expires_at = datetime.utcnow() + timedelta(minutes=int(os.getenv("RESET_TOKEN_EXP_MINUTES", 15)))
-    await cursor.execute(
-        "INSERT INTO tokensReset (email, token, expires_at) VALUES (?, ?, ?)",
-        (email, reset_token, expires_at.strftime("%Y-%m-%d %H:%M:%S"))
-    )
-    await conn.commit()
-    await cursor.close()
-    await conn.close()
+    # generate token and store in DB (replaces any older token for this email)
+    reset_token = await reset_tokens.issue(email)
 
     reset_link = f"{os.getenv('RESET_LINK_BASE')}?token={reset_token}&email={email}"
-    background_tasks.add_task(send_reset_email, email, reset_link)
+    await send_reset_email(email, reset_link)
     return {"message": "If this email is registered, a reset link has been sent."}
 
 # reset password
 @router.post("/reset-password")
-async def reset_password(email: EmailStr, token: str, new_password: str):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute(
-        "SELECT expires_at FROM tokensReset WHERE email = ? AND token = ?",
-        (email, token)
-    )
-    row = await cursor.fetchone()
-    if not row:
-        await cursor.close()
-        await conn.close()
+async def reset_password(request: Request, email: EmailStr, token: str, new_password: str):
+    enforce_throttle(request, email, 'reset')
+    token_status = await reset_tokens.check(email, token)
+    if token_status == 'invalid':
+        throttle.record_failure(email, client_ip(request), 'reset')
         raise HTTPException(status_code=400, detail="Invalid or expired token.")
-
-    expires_at = row[0]
-    if isinstance(expires_at, str):
-        expires_at = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
-    if datetime.utcnow() > expires_at:
-        await cursor.execute("DELETE FROM tokensReset WHERE email = ? AND token = ?", (email, token))
-        await conn.commit()
-        await cursor.close()
-        await conn.close()
+    if token_status == 'expired':
         raise HTTPException(status_code=400, detail="Token expired.")
 
-    # update pass
-    hashed_password = pwd_context.hash(new_password)
-    await cursor.execute(
-        "UPDATE Users SET UserPassword = ? WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
-        (hashed_password, email)
-    )
-    await cursor.execute("DELETE FROM tokensReset WHERE email = ?", (email,))
-    await conn.commit()
-    await cursor.close()
-    await conn.close()
-    return {"message": "Password has been reset successfully."}
\ No newline at end of file
+    # update pass — token check, password update and token delete commit together
+    hashed_password = await hashing.hash_password(new_password)
+    versions = await reset_tokens.redeem(email, token, hashed_password)
+    if versions is None:
+        raise HTTPException(status_code=400, detail="Invalid or expired token.")
+    invalidate_principal(*(username for username, _ in versions))
+    for (username, system), version in versions.items():
+        revocation.bump_version(username, system, version)
+    return {"message": "Password has been reset successfully."}
@@ -0,0 +1,376 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel
+from collections import Counter
+from database import get_db_connection, transaction
+from routers.auth import UserInDB, client_ip, invalidate_principal, role_required
+from routers.users import VALID_ROLES, VALID_SYSTEMS
+import asyncio
+import applog
+import auditlog
+import availability
+import hashing
+import os
+import refresh_tokens
+import revocation
+from availability import normalize
+from hashing import HashingBusyError, hash_password
+from typing import List, Optional
+
+router = APIRouter()
+logger = applog.get_logger("batch")
+
+# batch admin operations: every endpoint locks its target rows, applies the
+# change with set-based statements and commits once, then reports an
+# outcome per user id. a failure rolls the whole batch back.
+BATCH_MAX_USERS = int(os.getenv('BATCH_MAX_USERS', 1000))
+# ids per IN (...) list; SQL Server allows 2100 parameters per statement
+BATCH_IN_CHUNK = int(os.getenv('BATCH_IN_CHUNK', 500))
+
+TARGET_COLUMNS = ('UserID', 'Username', 'Email', 'System', 'UserRole', 'isDisabled')
+
+# patch field -> Users column
+PATCH_COLUMNS = {
+    'firstName': 'FirstName',
+    'middleName': 'MiddleName',
+    'lastName': 'LastName',
+    'suffix': 'Suffix',
+    'username': 'Username',
+    'password': 'UserPassword',
+    'email': 'Email',
+    'phoneNumber': 'PhoneNumber',
+}
+
+class UserFilter(BaseModel):
+    system: Optional[str] = None
+    userRole: Optional[str] = None
+    disabled: Optional[bool] = None
+
+# either explicit ids or a filter
+class UserSelection(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[UserFilter] = None
+
+class ReassignRequest(UserSelection):
+    userRole: Optional[str] = None
+    system: Optional[str] = None
+
+class UserPatch(BaseModel):
+    id: int
+    firstName: Optional[str] = None
+    middleName: Optional[str] = None
+    lastName: Optional[str] = None
+    suffix: Optional[str] = None
+    username: Optional[str] = None
+    password: Optional[str] = None
+    email: Optional[str] = None
+    phoneNumber: Optional[str] = None
+
+class BatchUpdateRequest(BaseModel):
+    users: List[UserPatch]
+
+
+def _chunks(items: list):
+    for i in range(0, len(items), BATCH_IN_CHUNK):
+        yield items[i:i + BATCH_IN_CHUNK]
+
+def _marks(n: int):
+    return ', '.join('?' for _ in range(n))
+
+# requested ids in order without repeats, or None for a filter
+def _selected_ids(selection: UserSelection):
+    if (selection.ids is None) == (selection.filter is None):
+        raise HTTPException(status_code=400, detail="Give either ids or filter")
+    if selection.filter is not None:
+        if not selection.filter.model_dump(exclude_none=True):
+            raise HTTPException(status_code=400, detail="Filter needs at least one criterion")
+        return None
+    ids = list(dict.fromkeys(selection.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="No ids given")
+    if len(ids) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"A batch is limited to {BATCH_MAX_USERS} users")
+    return ids
+
+def _filter_where(user_filter: UserFilter):
+    where, params = [], []
+    if user_filter.system is not None:
+        where.append('System = ?')
+        params.append(user_filter.system)
+    if user_filter.userRole is not None:
+        where.append('UserRole = ?')
+        params.append(user_filter.userRole)
+    if user_filter.disabled is not None:
+        where.append('isDisabled = ?')
+        params.append(1 if user_filter.disabled else 0)
+    return ' AND '.join(where), params
+
+# {UserID: target row} for the selection, locked until commit
+async def _select_targets(conn, cursor, selection: UserSelection, ids):
+    columns = ', '.join(TARGET_COLUMNS)
+    table = conn.backend.locked('Users')
+    if ids is not None:
+        rows = []
+        for chunk in _chunks(ids):
+            await cursor.execute(f"SELECT {columns} FROM {table} WHERE UserID IN ({_marks(len(chunk))})", tuple(chunk))
+            rows.extend(await cursor.fetchall())
+    else:
+        where, params = _filter_where(selection.filter)
+        sql = f"SELECT {columns} FROM {table} WHERE {where} ORDER BY UserID"
+        await cursor.execute(conn.backend.limit_sql(sql, BATCH_MAX_USERS + 1), tuple(params))
+        rows = await cursor.fetchall()
+        if len(rows) > BATCH_MAX_USERS:
+            raise HTTPException(status_code=400, detail=f"Filter matches more than {BATCH_MAX_USERS} users; narrow it")
+    return {
+        row[0]: {'id': row[0], 'username': row[1], 'email': row[2], 'system': row[3], 'role': row[4], 'disabled': bool(row[5])}
+        for row in rows
+    }
+
+async def _update_ids(cursor, assignments: str, params, ids):
+    for chunk in _chunks(ids):
+        await cursor.execute(
+            f"UPDATE Users SET {assignments} WHERE UserID IN ({_marks(len(chunk))})",
+            tuple(params) + tuple(chunk)
+        )
+
+# {UserID: detail} for rows whose username (within the system) or email (in
+# any system, as /create and /update check it) after the change would clash
+# with an active user outside `planned` or with an earlier row of the batch.
+# values compare case-folded, as the unique indexes do under SQL Server's
+# collation. planned: {UserID: (username, email or None to skip, system)}
+async def _conflicts(conn, cursor, planned: dict):
+    table = conn.backend.locked('Users')
+    taken_usernames, taken_emails = set(), set()
+    for column, position in (('Username', 0), ('Email', 1)):
+        values = sorted({p[position] for p in planned.values() if p[position]})
+        for chunk in _chunks(values):
+            await cursor.execute(
+                f"SELECT UserID, {column}, System FROM {table} WHERE isDisabled = 0 AND {column} IN ({_marks(len(chunk))})",
+                tuple(chunk)
+            )
+            for user_id, value, system in await cursor.fetchall():
+                if user_id in planned:
+                    continue
+                if column == 'Username':
+                    taken_usernames.add((normalize(value), system))
+                else:
+                    taken_emails.add(normalize(value))
+
+    conflicts = {}
+    for user_id, (username, email, system) in planned.items():
+        if (normalize(username), system) in taken_usernames:
+            conflicts[user_id] = f"Username '{username}' is already taken."
+        elif email and normalize(email) in taken_emails:
+            conflicts[user_id] = "Email is already used"
+        else:
+            taken_usernames.add((normalize(username), system))
+            if email:
+                taken_emails.add(normalize(email))
+    return conflicts
+
+def _report(order, outcomes: dict):
+    results = [outcomes.get(user_id) or {'id': user_id, 'status': 'not_found'} for user_id in order]
+    return {'summary': dict(Counter(r['status'] for r in results)), 'results': results}
+
+# run apply(cursor) in one transaction on a pooled connection
+async def _in_transaction(name: str, apply):
+    conn = await get_db_connection()
+    try:
+        async with transaction(conn) as cursor:
+            return await apply(conn, cursor)
+    except (HTTPException, HashingBusyError):
+        raise
+    except Exception as e:
+        if conn.backend.unique_violation(e):
+            raise HTTPException(status_code=409, detail="The batch conflicts with a concurrent change; nothing was applied.")
+        logger.exception(f"Error in {name}")
+        raise HTTPException(status_code=500, detail="An internal server error occurred; nothing was applied.")
+    finally:
+        await conn.close()
+
+# disable many users
+@router.post('/batch/disable')
+async def batch_disable(request: Request, body: UserSelection, current_user: UserInDB = Depends(role_required(['superadmin']))):
+    ids = _selected_ids(body)
+
+    async def apply(conn, cursor):
+        targets = await _select_targets(conn, cursor, body, ids)
+        changed = [t for t in targets.values() if not t['disabled']]
+        await _update_ids(cursor, 'isDisabled = 1', (), [t['id'] for t in changed])
+        await refresh_tokens.revoke_users(cursor, {(t['username'], t['system']) for t in changed})
+        versions = await revocation.persist_bumps(conn, cursor, [(t['username'], t['system']) for t in changed])
+        return targets, changed, versions
+
+    targets, changed, versions = await _in_transaction('batch_disable', apply)
+    if changed:
+        invalidate_principal(*{t['username'] for t in changed})
+    outcomes = {t['id']: {'id': t['id'], 'status': 'unchanged', 'detail': 'Already disabled'} for t in targets.values()}
+    for t in changed:
+        availability.note_inactive(t['system'], t['username'], t['email'])
+        revocation.mark_disabled(t['username'], t['system'], versions[(t['username'], t['system'])])
+        auditlog.record('user_disable', actor=current_user.username, target=t['username'], system=t['system'],
+                        client_ip=client_ip(request), user_id=t['id'], batch=True)
+        outcomes[t['id']] = {'id': t['id'], 'status': 'disabled'}
+    return _report(ids if ids is not None else list(targets), outcomes)
+
+# enable many users; refused where the account's username or email is now
+# held by another active user in the same system
+@router.post('/batch/enable')
+async def batch_enable(request: Request, body: UserSelection, current_user: UserInDB = Depends(role_required(['superadmin']))):
+    ids = _selected_ids(body)
+
+    async def apply(conn, cursor):
+        targets = await _select_targets(conn, cursor, body, ids)
+        candidates = {t['id']: (t['username'], t['email'], t['system']) for t in targets.values() if t['disabled']}
+        conflicts = await _conflicts(conn, cursor, candidates)
+        changed = [targets[user_id] for user_id in candidates if user_id not in conflicts]
+        await _update_ids(cursor, 'isDisabled = 0', (), [t['id'] for t in changed])
+        return targets, conflicts, changed
+
+    targets, conflicts, changed = await _in_transaction('batch_enable', apply)
+    if changed:
+        invalidate_principal(*{t['username'] for t in changed})
+    outcomes = {t['id']: {'id': t['id'], 'status': 'unchanged', 'detail': 'Already enabled'} for t in targets.values()}
+    outcomes.update({user_id: {'id': user_id, 'status': 'conflict', 'detail': detail} for user_id, detail in conflicts.items()})
+    for t in changed:
+        availability.note_active(t['system'], t['username'], t['email'])
+        revocation.mark_enabled(t['username'], t['system'])
+        auditlog.record('user_enable', actor=current_user.username, target=t['username'], system=t['system'],
+                        client_ip=client_ip(request), user_id=t['id'], batch=True)
+        outcomes[t['id']] = {'id': t['id'], 'status': 'enabled'}
+    return _report(ids if ids is not None else list(targets), outcomes)
+
+# move many users to another role and/or system. outstanding access tokens
+# carry the old role and system, so they are revoked
+@router.post('/batch/reassign')
+async def batch_reassign(request: Request, body: ReassignRequest, current_user: UserInDB = Depends(role_required(['superadmin']))):
+    if body.userRole is None and body.system is None:
+        raise HTTPException(status_code=400, detail="Give userRole and/or system")
+    if body.userRole is not None and body.userRole not in VALID_ROLES:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    if body.system is not None and body.system not in VALID_SYSTEMS:
+        raise HTTPException(status_code=400, detail="Invalid system")
+    ids = _selected_ids(body)
+    assignments, params = [], []
+    if body.userRole is not None:
+        assignments.append('UserRole = ?')
+        params.append(body.userRole)
+    if body.system is not None:
+        assignments.append('System = ?')
+        params.append(body.system)
+
+    async def apply(conn, cursor):
+        targets = await _select_targets(conn, cursor, body, ids)
+        moving = [
+            t for t in targets.values()
+            if (body.userRole or t['role']) != t['role'] or (body.system or t['system']) != t['system']
+        ]
+        # only active rows moving to another system can clash, and only on
+        # username: emails are already unique across systems
+        conflicts = await _conflicts(conn, cursor, {
+            t['id']: (t['username'], None, body.system)
+            for t in moving if body.system and body.system != t['system'] and not t['disabled']
+        })
+        changed = [t for t in moving if t['id'] not in conflicts]
+        await _update_ids(cursor, ', '.join(assignments), params, [t['id'] for t in changed])
+        # refresh tokens are bound to the old system
+        await refresh_tokens.revoke_users(cursor, {
+            (t['username'], t['system']) for t in changed if body.system and body.system != t['system']
+        })
+        versions = await revocation.persist_bumps(conn, cursor, [(t['username'], t['system']) for t in changed])
+        return targets, conflicts, changed, versions
+
+    targets, conflicts, changed, versions = await _in_transaction('batch_reassign', apply)
+    if changed:
+        invalidate_principal(*{t['username'] for t in changed})
+    outcomes = {t['id']: {'id': t['id'], 'status': 'unchanged'} for t in targets.values()}
+    outcomes.update({user_id: {'id': user_id, 'status': 'conflict', 'detail': detail} for user_id, detail in conflicts.items()})
+    for t in changed:
+        new_role, new_system = body.userRole or t['role'], body.system or t['system']
+        revocation.bump_version(t['username'], t['system'], versions[(t['username'], t['system'])])
+        if new_system != t['system'] and not t['disabled']:
+            availability.note_inactive(t['system'], t['username'], t['email'])
+            availability.note_active(new_system, t['username'], t['email'])
+            revocation.mark_enabled(t['username'], new_system)
+        auditlog.record('user_reassign', actor=current_user.username, target=t['username'], system=t['system'],
+                        client_ip=client_ip(request), user_id=t['id'], batch=True,
+                        from_role=t['role'], to_role=new_role, to_system=new_system)
+        outcomes[t['id']] = {'id': t['id'], 'status': 'updated'}
+    return _report(ids if ids is not None else list(targets), outcomes)
+
+# partial update of many users, each with its own fields. passwords are
+# hashed in parallel before the transaction opens, so no locks are held
+# while hashing
+@router.post('/batch/update')
+async def batch_update(request: Request, body: BatchUpdateRequest, current_user: UserInDB = Depends(role_required(['superadmin']))):
+    if not body.users:
+        raise HTTPException(status_code=400, detail="No users given")
+    if len(body.users) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"A batch is limited to {BATCH_MAX_USERS} users")
+
+    order, outcomes, patches = [], {}, {}
+    for patch in body.users:
+        fields = patch.model_dump(exclude_none=True)
+        user_id = fields.pop('id')
+        if user_id in patches or user_id in outcomes:
+            continue
+        order.append(user_id)
+        if not fields:
+            outcomes[user_id] = {'id': user_id, 'status': 'invalid', 'detail': 'No fields to update'}
+        elif any(not fields[f].strip() for f in ('username', 'password', 'email') if f in fields):
+            outcomes[user_id] = {'id': user_id, 'status': 'invalid', 'detail': 'Username, password and email cannot be blank'}
+        else:
+            patches[user_id] = fields
+
+    # hash in parallel, no more at once than the hashing pool has workers
+    sem = asyncio.Semaphore(hashing.HASH_WORKERS)
+
+    async def hash_one(fields):
+        async with sem:
+            fields['password'] = await hash_password(fields['password'])
+
+    await asyncio.gather(*(hash_one(fields) for fields in patches.values() if 'password' in fields))
+
+    async def apply(conn, cursor):
+        targets = await _select_targets(conn, cursor, UserSelection(ids=list(patches)), list(patches))
+        found = {user_id: fields for user_id, fields in patches.items() if user_id in targets}
+        conflicts = await _conflicts(conn, cursor, {
+            user_id: (fields.get('username', targets[user_id]['username']), fields.get('email'), targets[user_id]['system'])
+            for user_id, fields in found.items()
+            if ('username' in fields or 'email' in fields) and not targets[user_id]['disabled']
+        })
+        changed = {user_id: fields for user_id, fields in found.items() if user_id not in conflicts}
+
+        # one executemany per distinct set of fields
+        groups = {}
+        for user_id, fields in changed.items():
+            groups.setdefault(tuple(sorted(fields)), []).append(user_id)
+        for names, user_ids in groups.items():
+            await cursor.executemany(
+                f"UPDATE Users SET {', '.join(f'{PATCH_COLUMNS[n]} = ?' for n in names)} WHERE UserID = ?",
+                [tuple(changed[user_id][n] for n in names) + (user_id,) for user_id in user_ids]
+            )
+        credentials_changed = [
+            user_id for user_id, fields in changed.items()
+            if 'password' in fields or fields.get('username', targets[user_id]['username']) != targets[user_id]['username']
+        ]
+        principals = [(targets[i]['username'], targets[i]['system']) for i in credentials_changed]
+        await refresh_tokens.revoke_users(cursor, set(principals))
+        versions = await revocation.persist_bumps(conn, cursor, principals)
+        return targets, conflicts, changed, versions
+
+    targets, conflicts, changed, versions = await _in_transaction('batch_update', apply)
+    if changed:
+        invalidate_principal(*{targets[i]['username'] for i in changed}, *{f['username'] for f in changed.values() if 'username' in f})
+    for (username, system), version in versions.items():
+        revocation.bump_version(username, system, version)
+    outcomes.update({user_id: {'id': user_id, 'status': 'conflict', 'detail': detail} for user_id, detail in conflicts.items()})
+    for user_id, fields in changed.items():
+        t = targets[user_id]
+        if not t['disabled'] and ('username' in fields or 'email' in fields):
+            availability.note_inactive(t['system'], t['username'] if 'username' in fields else None, t['email'] if 'email' in fields else None)
+            availability.note_active(t['system'], fields.get('username'), fields.get('email'))
+        auditlog.record('user_update', actor=current_user.username, target=t['username'], system=t['system'],
+                        client_ip=client_ip(request), user_id=user_id, batch=True,
+                        fields=[PATCH_COLUMNS[n] for n in sorted(fields)], new_username=fields.get('username'))
+        outcomes[user_id] = {'id': user_id, 'status': 'updated'}
+    return _report(order, outcomes)
@@ -0,0 +1,255 @@
+from fastapi import APIRouter, HTTPException, Depends, File, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from database import get_db_connection, transaction
+from routers.auth import UserInDB, client_ip, role_required, invalidate_principal
+from routers.users import validate_new_user
+from availability import normalize
+import asyncio
+import csv
+import applog
+import auditlog
+import availability
+import hashing
+import io
+import json
+import os
+import revocation
+from hashing import HashingBusyError, hash_password
+from typing import Optional
+
+router = APIRouter()
+logger = applog.get_logger("bulk")
+
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 500))
+BULK_IMPORT_MAX_ROWS = int(os.getenv('BULK_IMPORT_MAX_ROWS', 10000))
+
+IMPORT_FIELDS = ['firstName', 'middleName', 'lastName', 'suffix', 'username', 'password', 'email', 'phoneNumber', 'userRole', 'system']
+EXPORT_COLUMNS = ['UserID', 'Username', 'Email', 'UserRole', 'System', 'isDisabled', 'CreatedAt', 'PhoneNumber', 'FirstName', 'MiddleName', 'LastName', 'Suffix']
+
+def _import_format(file: UploadFile, format: Optional[str]):
+    if format:
+        return format
+    name = (file.filename or '').lower()
+    if name.endswith('.ndjson') or name.endswith('.jsonl') or 'ndjson' in (file.content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+# (line number, row dict) from the upload without loading it whole
+def _iter_rows(file: UploadFile, format: str):
+    text = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+
+# up to n rows; runs in a worker thread, since reading the spooled upload blocks
+def _next_rows(rows, n: int):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= n:
+            break
+    return batch
+
+def _clean(row: dict):
+    cleaned = {}
+    for field in IMPORT_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        cleaned[field] = value if value not in ('', None) else None
+    return cleaned
+
+# validate, dedupe, hash and insert one chunk; appends to results
+async def _import_chunk(chunk, seen_usernames: set, seen_emails: set, results: list, audit: dict):
+    candidates = []
+    for line_num, row in chunk:
+        if row is None:
+            results.append({'line': line_num, 'status': 'error', 'detail': 'Malformed row'})
+            continue
+        user = _clean(row)
+        error = validate_new_user(user['userRole'], user['system'], user['username'], user['password'])
+        if not error:
+            missing = [f for f in ('firstName', 'lastName', 'email') if not user[f]]
+            if missing:
+                error = f"Missing {', '.join(missing)}"
+        # compared case-folded, as the unique indexes compare under SQL Server's collation
+        if not error and normalize(user['email']) in seen_emails:
+            error = "Email is duplicated in file"
+        if not error and normalize(user['username']) in seen_usernames:
+            error = "Username is duplicated in file"
+        if error:
+            results.append({'line': line_num, 'username': user['username'], 'status': 'error', 'detail': error})
+            continue
+        seen_emails.add(normalize(user['email']))
+        seen_usernames.add(normalize(user['username']))
+        candidates.append((line_num, user))
+
+    if not candidates:
+        return
+
+    conn = await get_db_connection()
+    try:
+        # one set-based duplicate check against active users
+        usernames = [u['username'] for _, u in candidates]
+        emails = [u['email'] for _, u in candidates]
+        cursor = await conn.cursor()
+        try:
+            await cursor.execute(
+                f'''SELECT Username, Email FROM Users WHERE isDisabled = 0 AND (
+                    Username IN ({', '.join('?' for _ in usernames)}) OR Email IN ({', '.join('?' for _ in emails)}))''',
+                tuple(usernames + emails)
+            )
+            existing = await cursor.fetchall()
+        finally:
+            await cursor.close()
+        taken_usernames = {normalize(r[0]) for r in existing if r[0]}
+        taken_emails = {normalize(r[1]) for r in existing if r[1]}
+
+        to_insert = []
+        for line_num, user in candidates:
+            if normalize(user['email']) in taken_emails:
+                results.append({'line': line_num, 'username': user['username'], 'status': 'error', 'detail': "Email is already used"})
+            elif normalize(user['username']) in taken_usernames:
+                results.append({'line': line_num, 'username': user['username'], 'status': 'error', 'detail': f"Username '{user['username']}' is already taken."})
+            else:
+                to_insert.append((line_num, user))
+        if not to_insert:
+            return
+
+        # hash in parallel, no more at once than the hashing pool has workers
+        sem = asyncio.Semaphore(hashing.HASH_WORKERS)
+
+        async def hash_one(password):
+            async with sem:
+                return await hash_password(password)
+
+        try:
+            hashes = await asyncio.gather(*(hash_one(u['password']) for _, u in to_insert))
+        except HashingBusyError:
+            # earlier chunks are committed; report this one rather than fail the request
+            for line_num, user in to_insert:
+                results.append({'line': line_num, 'username': user['username'], 'status': 'error', 'detail': "Hashing busy, retry"})
+            return
+
+        now = datetime.utcnow()
+        params = [
+            (hashed, u['email'], u['userRole'], 0, now, u['system'], u['username'], u['phoneNumber'],
+             u['firstName'], u['middleName'], u['lastName'], u['suffix'])
+            for hashed, (_, u) in zip(hashes, to_insert)
+        ]
+        try:
+            async with transaction(conn) as cursor:
+                await cursor.executemany('''
+                    INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', params)
+        except Exception:
+            logger.exception("Error in bulk_import chunk")
+            for line_num, user in to_insert:
+                results.append({'line': line_num, 'username': user['username'], 'status': 'error', 'detail': "Insert failed; chunk rolled back"})
+            return
+
+        # one publish per chunk, not per row
+        invalidate_principal(*(u['username'] for _, u in to_insert))
+        availability.note_active_many((u['system'], u['username'], u['email']) for _, u in to_insert)
+        revocation.mark_enabled_many((u['username'], u['system']) for _, u in to_insert)
+        for line_num, user in to_insert:
+            auditlog.record('user_create', target=user['username'], system=user['system'], role=user['userRole'], bulk=True, **audit)
+            results.append({'line': line_num, 'username': user['username'], 'status': 'created'})
+    finally:
+        await conn.close()
+
+# bulk import users from csv (header row) or ndjson, same fields as /create
+@router.post('/bulk-import')
+async def bulk_import_users(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern='^(csv|ndjson)$'),
+    current_user: UserInDB = Depends(role_required(['superadmin'])),
+):
+    results = []
+    seen_usernames, seen_emails = set(), set()
+    audit = {'actor': current_user.username, 'client_ip': client_ip(request)}
+    rows = 0
+    try:
+        source = _iter_rows(file, _import_format(file, format))
+        while rows < BULK_IMPORT_MAX_ROWS:
+            chunk = await asyncio.to_thread(_next_rows, source, min(BULK_CHUNK_SIZE, BULK_IMPORT_MAX_ROWS - rows))
+            if not chunk:
+                break
+            rows += len(chunk)
+            await _import_chunk(chunk, seen_usernames, seen_emails, results, audit)
+        else:
+            extra = await asyncio.to_thread(_next_rows, source, 1)
+            if extra:
+                results.append({'line': extra[0][0], 'status': 'error', 'detail': f"Import is limited to {BULK_IMPORT_MAX_ROWS} rows"})
+    except HTTPException:
+        raise
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse upload: {e}")
+    except Exception:
+        logger.exception("Error in bulk_import_users")
+        raise HTTPException(status_code=500, detail="An internal server error occurred during bulk import.")
+
+    results.sort(key=lambda r: r['line'])
+    created = sum(1 for r in results if r['status'] == 'created')
+    return {'created': created, 'failed': len(results) - created, 'results': results}
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def _stream_export(format: str):
+    conn = None
+    cursor = None
+    try:
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
+        await cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM Users ORDER BY UserID")
+        if format == 'csv':
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(EXPORT_COLUMNS)
+            yield buf.getvalue()
+        while True:
+            rows = await cursor.fetchmany(BULK_CHUNK_SIZE)
+            if not rows:
+                break
+            if format == 'csv':
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerows([_export_value(v) for v in row] for row in rows)
+                yield buf.getvalue()
+            else:
+                yield ''.join(
+                    json.dumps({c: _export_value(v) for c, v in zip(EXPORT_COLUMNS, row)}) + '\n' for row in rows
+                )
+    except Exception:
+        # headers are already sent, so the stream just ends early
+        logger.exception("Error in bulk_export_users")
+    finally:
+        if cursor: await cursor.close()
+        if conn: await conn.close()
+
+# stream every Users row (without password hashes) for backups and audits
+@router.get('/bulk-export', dependencies=[Depends(role_required(['superadmin']))])
+async def bulk_export_users(format: str = Query('csv', pattern='^(csv|ndjson)$')):
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    filename = f"users-{datetime.utcnow():%Y%m%d%H%M%S}.{format}"
+    return StreamingResponse(
+        _stream_export(format),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
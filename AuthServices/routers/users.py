@@ -1,15 +1,70 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Form
+from fastapi import APIRouter, HTTPException, Depends, status, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from database import get_db_connection 
-from routers.auth import get_current_active_user, role_required 
-import bcrypt
+from database import get_db_connection, transaction
+from routers.auth import UserInDB, client_ip, role_required, invalidate_principal 
+import applog
+import auditlog
+import availability
+import refresh_tokens
+import revocation
+import throttle
+import userdata
+from cache import TTLCache
+from hashing import HashingBusyError, hash_password
 from typing import Optional
+import base64
+import json
+import math
+import os
 
 router = APIRouter()
+logger = applog.get_logger("users")
+
+VALID_ROLES = ['admin', 'manager', 'staff', 'cashier', 'rider', 'super admin']
+VALID_SYSTEMS = ['IMS', 'POS', 'OOS', 'AUTH']
+
+# role/system/credential rules for admin-created users; returns an error or None
+def validate_new_user(userRole: str, system: str, username: str, password: str):
+    if userRole not in VALID_ROLES:
+        return "Invalid role"
+    if system not in VALID_SYSTEMS:
+        return "Invalid system"
+    if not password or not password.strip():
+        return "Password is required"
+    if not username or not username.strip():
+        return "Username is required"
+    return None
+
+# writes are single conditional statements backed by the filtered unique
+# indexes UX_Users_Username_System and UX_Users_Email_System (see
+# migrations/<backend>/0003_lookup_indexes.sql), so concurrent requests
+# can't both pass an existence check
+INSERT_USER_COLUMNS = 'UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix'
+
+# INSERT ... SELECT that inserts nothing when `conflict` matches an active row
+def _insert_user_unless(conn, conflict: str):
+    return f'''
+        INSERT INTO Users ({INSERT_USER_COLUMNS})
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM {conn.backend.locked('Users')} WHERE isDisabled = 0 AND ({conflict}))
+    '''
+
+# which of email/username was taken; only runs after a write was refused
+async def _conflict_detail(conn, cursor, exc, email, email_detail, username_detail, system=None):
+    if exc is not None:
+        message = conn.backend.unique_violation(exc)
+        if message is None:
+            return None
+        return email_detail if 'Email' in message else username_detail
+    scope = " AND System = ?" if system else ""
+    await cursor.execute(f"SELECT 1 FROM Users WHERE Email = ? AND isDisabled = 0{scope}", (email, system) if system else (email,))
+    return email_detail if await cursor.fetchone() else username_detail
 
 # create users
-@router.post('/create', dependencies=[Depends(role_required(["superadmin"]))])
+@router.post('/create')
 async def create_user(
+    request: Request,
     firstName: str = Form(...),
     middleName: Optional[str] = Form(None),
     lastName: str = Form(...),
@@ -20,44 +75,42 @@ async def create_user(
     phoneNumber: Optional[str] = Form(None),
     userRole: str = Form(...),
     system: str = Form(...),
-
+    current_user: UserInDB = Depends(role_required(["superadmin"])),
 ):
-    if userRole not in ['admin', 'manager', 'staff', 'cashier', 'rider', 'super admin']:
-        raise HTTPException(status_code=400, detail="Invalid role")
-    if system not in ['IMS', 'POS', 'OOS', 'AUTH']:
-        raise HTTPException(status_code=400, detail="Invalid system")
-    if not password.strip(): 
-        raise HTTPException(status_code=400, detail="Password is required")
-    
-    if not username.strip():
-            raise HTTPException(status_code=400, detail="Username is required")
+    error = validate_new_user(userRole, system, username, password)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
     conn = None 
     cursor = None
     try:
+        hashed_password = await hash_password(password)
+
         conn = await get_db_connection()
         cursor = await conn.cursor()
+        email_detail, username_detail = "Email is already used", f"Username '{username}' is already taken."
+        try:
+            await cursor.execute(
+                _insert_user_unless(conn, "Email = ? OR Username = ?"),
+                (hashed_password, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix,
+                 email, username)
+            )
+        except Exception as e:
+            detail = await _conflict_detail(conn, cursor, e, email, email_detail, username_detail)
+            if detail is None:
+                raise
+            raise HTTPException(status_code=400, detail=detail)
+        if cursor.rowcount != 1:
+            raise HTTPException(status_code=400, detail=await _conflict_detail(conn, cursor, None, email, email_detail, username_detail))
+        invalidate_principal(username)
+        availability.note_active(system, username, email)
+        revocation.mark_enabled(username, system)
+        auditlog.record('user_create', actor=current_user.username, target=username, system=system, client_ip=client_ip(request), role=userRole)
 
-        await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND isDisabled = 0", (email,))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email is already used")
-
-        await cursor.execute("SELECT 1 FROM Users WHERE Username = ? AND isDisabled = 0", (username,))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail=f"Username '{username}' is already taken.")
-
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        await cursor.execute('''
-            INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (hashed_password, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix))
-        await conn.commit()
-
-    except HTTPException: 
+    except (HTTPException, HashingBusyError): 
         raise
-    except Exception as e:
-        print(f"Error in create_user: {e}") 
+    except Exception:
+        logger.exception("Error in create_user")
         raise HTTPException(status_code=500, detail=f"An internal server error occurred during user creation.")
     finally:
         if cursor:
@@ -67,56 +120,220 @@ async def create_user(
 
     return {'message': f'{userRole.capitalize()} created successfully!'}
 
-# get users
+# list-users paging
+LIST_USERS_DEFAULT_LIMIT = int(os.getenv('LIST_USERS_DEFAULT_LIMIT', 100))
+LIST_USERS_MAX_LIMIT = int(os.getenv('LIST_USERS_MAX_LIMIT', 1000))
+LIST_USERS_STREAM_CHUNK = int(os.getenv('LIST_USERS_STREAM_CHUNK', 500))
+LIST_USERS_CACHE_SIZE = int(os.getenv('LIST_USERS_CACHE_SIZE', 256))
+LIST_USERS_CACHE_TTL_SECONDS = float(os.getenv('LIST_USERS_CACHE_TTL_SECONDS', 300))
+
+# serialised json pages keyed by (user data version, query); a write moves
+# the version, so stale pages are never served and simply age out
+_list_users_cache = TTLCache("list_users", maxsize=LIST_USERS_CACHE_SIZE, ttl=LIST_USERS_CACHE_TTL_SECONDS)
+
+# output field -> Users columns it is built from
+USER_FIELDS = {
+    'userID': ('UserID',),
+    'fullName': ('FirstName', 'MiddleName', 'LastName', 'Suffix'),
+    'username': ('Username',),
+    'email': ('Email',),
+    'userRole': ('UserRole',),
+    'createdAt': ('CreatedAt',),
+    'system': ('System',),
+    'phoneNumber': ('PhoneNumber',),
+    'isDisabled': ('isDisabled',),
+}
+
+# UserID is an identity column, so it also orders rows by creation
+SORT_COLUMNS = {
+    'userID': 'UserID',
+    'createdAt': 'UserID',
+    'username': 'Username',
+}
+
+def _encode_cursor(sort_value, user_id):
+    raw = json.dumps([sort_value, user_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor: str):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, user_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, int(user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _like_prefix(value: str):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('[', '\\[')
+    return escaped + '%'
+
+def _user_columns(fields: list[str], sort_column: str):
+    columns = ['UserID', sort_column]
+    for field in fields:
+        columns.extend(USER_FIELDS[field])
+    return list(dict.fromkeys(columns))
+
+def _user_row(row, index: dict, fields: list[str]):
+    user = {}
+    for field in fields:
+        if field == 'fullName':
+            # filter out any None or empty string parts and join them with a space
+            name_parts = [row[index[c]] for c in USER_FIELDS['fullName']]
+            user['fullName'] = ' '.join(part for part in name_parts if part)
+        elif field == 'createdAt':
+            created_at = row[index['CreatedAt']]
+            user['createdAt'] = created_at.isoformat() if created_at else None
+        elif field == 'isDisabled':
+            user['isDisabled'] = bool(row[index['isDisabled']])
+        else:
+            user[field] = row[index[USER_FIELDS[field][0]]]
+    return user
+
+def _list_users_query(columns, sort_column, descending, after, system, role, disabled, name, email):
+    where = []
+    params = []
+    if system is not None:
+        where.append('System = ?')
+        params.append(system)
+    if role is not None:
+        where.append('UserRole = ?')
+        params.append(role)
+    if disabled is not None:
+        where.append('isDisabled = ?')
+        params.append(1 if disabled else 0)
+    if name:
+        prefix = _like_prefix(name)
+        where.append("(FirstName LIKE ? ESCAPE '\\' OR LastName LIKE ? ESCAPE '\\' OR Username LIKE ? ESCAPE '\\')")
+        params.extend([prefix, prefix, prefix])
+    if email:
+        where.append("Email LIKE ? ESCAPE '\\'")
+        params.append(_like_prefix(email))
+
+    # keyset: resume strictly after the last (sort value, UserID) seen
+    if after is not None:
+        sort_value, user_id = after
+        op = '<' if descending else '>'
+        if sort_column == 'UserID':
+            where.append(f'UserID {op} ?')
+            params.append(user_id)
+        else:
+            where.append(f'({sort_column} {op} ? OR ({sort_column} = ? AND UserID {op} ?))')
+            params.extend([sort_value, sort_value, user_id])
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {', '.join(columns)} FROM Users"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if sort_column == 'UserID':
+        sql += f' ORDER BY UserID {direction}'
+    else:
+        sql += f' ORDER BY {sort_column} {direction}, UserID {direction}'
+    return sql, params
+
+# get users — keyset pages as a json array (next page in X-Next-Cursor) or an
+# ndjson stream. both carry an ETag from the user data version; a matching
+# If-None-Match is answered 304 before any query
 @router.get('/list-users', dependencies=[Depends(role_required(['superadmin']))])
-async def list_users():
+async def list_users(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_USERS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    system: Optional[str] = None,
+    role: Optional[str] = None,
+    disabled: Optional[bool] = None,
+    name: Optional[str] = Query(None, description="Prefix of first name, last name or username"),
+    email: Optional[str] = Query(None, description="Email prefix"),
+    sort: str = Query('userID', pattern='^(userID|createdAt|username)$'),
+    order: str = Query('asc', pattern='^(asc|desc)$'),
+    fields: Optional[str] = Query(None, description="Comma-separated output fields"),
+    format: str = Query('json', pattern='^(json|ndjson)$'),
+):
+    selected = list(USER_FIELDS) if not fields else [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in selected if f not in USER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    # read before querying: a write landing mid-query moves the version on
+    query_key = tuple(sorted(request.query_params.multi_items()))
+    version = userdata.version()
+    tag = userdata.etag('list-users', query_key)
+    if userdata.not_modified(request.headers.get('if-none-match'), tag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=userdata.headers(tag))
+
+    sort_column = SORT_COLUMNS[sort]
+    descending = order == 'desc'
+    after = _decode_cursor(cursor) if cursor else None
+    columns = _user_columns(selected, sort_column)
+    index = {c: i for i, c in enumerate(columns)}
+    sql, params = _list_users_query(columns, sort_column, descending, after, system, role, disabled, name, email)
+
+    if format == 'ndjson':
+        return StreamingResponse(
+            _stream_users(sql, params, limit, index, selected), media_type='application/x-ndjson', headers=userdata.headers(tag)
+        )
+
+    limit = limit or LIST_USERS_DEFAULT_LIMIT
+    body, next_cursor = await _list_users_cache.get_or_load(
+        (version, query_key), lambda: _list_users_page(sql, params, limit, index, selected, sort_column)
+    )
+    headers = userdata.headers(tag)
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+        headers['Link'] = f'<{next_url}>; rel="next"'
+    return Response(content=body, media_type='application/json', headers=headers)
+
+# (serialised page, cursor for the next page or None)
+async def _list_users_page(sql, params, limit, index, fields, sort_column):
+    conn = None
+    db_cursor = None
+    try:
+        conn = await get_db_connection()
+        db_cursor = await conn.cursor()
+        # one extra row tells us whether there is a next page
+        await db_cursor.execute(conn.backend.limit_sql(sql, limit + 1), tuple(params))
+        users_db = await db_cursor.fetchall()
+    except Exception:
+        logger.exception("Error in list_users")
+        raise HTTPException(status_code=500, detail="Failed to retrieve user list.")
+    finally:
+        if db_cursor: await db_cursor.close()
+        if conn: await conn.close()
+
+    next_cursor = None
+    if len(users_db) > limit:
+        users_db = users_db[:limit]
+        last = users_db[-1]
+        next_cursor = _encode_cursor(last[index[sort_column]], last[index['UserID']])
+
+    body = json.dumps([_user_row(u, index, fields) for u in users_db], ensure_ascii=False, separators=(',', ':'))
+    return body.encode('utf-8'), next_cursor
+
+async def _stream_users(sql, params, limit, index, fields):
     conn = None
     cursor = None
     try:
         conn = await get_db_connection()
         cursor = await conn.cursor()
-        await cursor.execute(''' 
-            SELECT UserID, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix
-            FROM Users
-        ''')
-        users_db = await cursor.fetchall()
-    except Exception as e:
-        print(f"Error in list_users: {e}")
-        raise HTTPException(status_code=500, detail="Failed to retrieve user list.")
+        if limit:
+            sql = conn.backend.limit_sql(sql, limit)
+        await cursor.execute(sql, tuple(params))
+        while True:
+            rows = await cursor.fetchmany(LIST_USERS_STREAM_CHUNK)
+            if not rows:
+                break
+            yield ''.join(json.dumps(_user_row(u, index, fields)) + '\n' for u in rows)
+    except Exception:
+        # headers are already sent, so the stream just ends early
+        logger.exception("Error in list_users stream")
     finally:
         if cursor: await cursor.close()
         if conn: await conn.close()
 
-    users_list = []
-    for u in users_db:
-        # concatenate
-        first_name = u[8]
-        middle_name = u[9]
-        last_name = u[10]
-        suffix = u[11]
-
-        # list existing users
-        name_parts = [first_name, middle_name, last_name, suffix]
-        # Filter out any None or empty string parts and join them with a space
-        full_name = ' '.join(part for part in name_parts if part)
-        
-        # use the full name in the user dictionary
-        users_list.append({
-            "userID": u[0],
-            "fullName": full_name,  # concatenated full name
-            "username": u[6],
-            "email": u[1],
-            "userRole": u[2],
-            "createdAt": u[4].isoformat() if u[4] else None,
-            "system": u[5],
-            "phoneNumber": u[7],
-            "isDisabled": bool(u[3])
-        })
-    return users_list
-
 # update users
-@router.put("/update/{user_id}", dependencies=[Depends(role_required(['superadmin']))])
+@router.put("/update/{user_id}")
 async def update_user(
+    request: Request,
     user_id: int,
     firstName: Optional[str] = Form(None),
     middleName: Optional[str] = Form(None),
@@ -126,24 +343,15 @@ async def update_user(
     password: Optional[str] = Form(None), 
     email: Optional[str] = Form(None),
     phoneNumber: Optional[str] = Form(None),
+    current_user: UserInDB = Depends(role_required(['superadmin'])),
 ):
     conn = None
     cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute("SELECT UserRole FROM Users WHERE UserID = ?", (user_id,))
-        if not await cursor.fetchone():
-            raise HTTPException(status_code=404, detail="User not found")
-        
         updates = []
         values = []
 
-
         if email:
-            await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND UserID != ? AND isDisabled = 0", (email, user_id))
-            if await cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Email is already used by another user")
             updates.append('Email = ?')
             values.append(email)
         
@@ -152,7 +360,7 @@ async def update_user(
             values.append(phoneNumber)
 
         if password:
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            hashed_password = await hash_password(password)
             updates.append('UserPassword = ?')
             values.append(hashed_password)  
         
@@ -176,17 +384,68 @@ async def update_user(
             updates.append('Username = ?')
             values.append(username)
 
+        conn = await get_db_connection()
+        cursor = await conn.cursor()
         if not updates:
+            await cursor.execute("SELECT 1 FROM Users WHERE UserID = ?", (user_id,))
+            if not await cursor.fetchone():
+                raise HTTPException(status_code=404, detail="User not found")
             return {'message': 'No fields to update'}
 
-        values.append(user_id)
-        
-        await cursor.execute(f"UPDATE Users SET {', '.join(updates)} WHERE UserID = ?", tuple(values))
-        await conn.commit()
+        where, where_params = "UserID = ?", [user_id]
+        if email:
+            where += f" AND NOT EXISTS (SELECT 1 FROM {conn.backend.locked('Users')} WHERE Email = ? AND UserID <> ? AND isDisabled = 0)"
+            where_params += [email, user_id]
+        email_detail, username_detail = "Email is already used by another user", f"Username '{username}' is already taken."
+
+        async def apply(cursor):
+            rows = await conn.backend.update_returning_old(
+                cursor, 'Users', ', '.join(updates), values, where, where_params, ('Username', 'System', 'Email')
+            )
+            existing = rows[0] if rows else None
+            credentials_changed = existing and (password or (username is not None and username != existing[0]))
+            versions = {}
+            if credentials_changed:
+                await refresh_tokens.revoke_user(cursor, existing[0], existing[1])
+                versions = await revocation.persist_bumps(conn, cursor, [(existing[0], existing[1])])
+            return existing, versions
+
+        try:
+            # one statement unless refresh tokens and the token version have to go in the same transaction
+            if password or username is not None:
+                async with transaction(conn) as tx_cursor:
+                    existing, versions = await apply(tx_cursor)
+            else:
+                existing, versions = await apply(cursor)
+        except Exception as e:
+            detail = await _conflict_detail(conn, cursor, e, email, email_detail, username_detail)
+            if detail is None:
+                raise
+            raise HTTPException(status_code=400, detail=detail)
+
+        if not existing:
+            await cursor.execute("SELECT 1 FROM Users WHERE UserID = ?", (user_id,))
+            if not await cursor.fetchone():
+                raise HTTPException(status_code=404, detail="User not found")
+            raise HTTPException(status_code=400, detail=email_detail)
+
+        invalidate_principal(existing[0], username)
+        if username not in (None, existing[0]) or email not in (None, '', existing[2]):
+            availability.note_inactive(
+                existing[1], existing[0] if username not in (None, existing[0]) else None, existing[2] if email and email != existing[2] else None
+            )
+            availability.note_active(existing[1], username, email)
+        # outstanding tokens no longer match the row
+        for (old_username, old_system), version in versions.items():
+            revocation.bump_version(old_username, old_system, version)
+        auditlog.record(
+            'user_update', actor=current_user.username, target=existing[0], system=existing[1], client_ip=client_ip(request),
+            user_id=user_id, fields=[u.split(' = ')[0] for u in updates], new_username=username,
+        )
                 
-    except HTTPException: raise
-    except Exception as e:
-        print(f"Error in update_user: {e}")
+    except (HTTPException, HashingBusyError): raise
+    except Exception:
+        logger.exception("Error in update_user")
         raise HTTPException(status_code=500, detail="An internal server error occurred during user update.")
     finally:
         if cursor: await cursor.close()
@@ -195,21 +454,28 @@ async def update_user(
     return {'message': 'User updated successfully'}
 
 # disable user
-@router.put('/disable/{user_id}', dependencies=[Depends(role_required(['superadmin']))])
-async def disable_user(user_id: int):
+@router.put('/disable/{user_id}')
+async def disable_user(request: Request, user_id: int, current_user: UserInDB = Depends(role_required(['superadmin']))):
     conn = None
     cursor = None
     try:
         conn = await get_db_connection()
         cursor = await conn.cursor()
-        await cursor.execute("SELECT 1 FROM Users WHERE UserID = ? AND isDisabled = 0", (user_id,))
-        if not await cursor.fetchone():
+        await cursor.execute("SELECT Username, System, Email FROM Users WHERE UserID = ? AND isDisabled = 0", (user_id,))
+        existing = await cursor.fetchone()
+        if not existing:
             raise HTTPException(status_code=404, detail="User not found or already disabled.")
-        await cursor.execute("UPDATE Users SET isDisabled = 1 WHERE UserID = ? ", (user_id,))
-        await conn.commit()
+        async with transaction(conn) as tx_cursor:
+            await tx_cursor.execute("UPDATE Users SET isDisabled = 1 WHERE UserID = ? ", (user_id,))
+            await refresh_tokens.revoke_user(tx_cursor, existing[0], existing[1])
+            versions = await revocation.persist_bumps(conn, tx_cursor, [(existing[0], existing[1])])
+        invalidate_principal(existing[0])
+        availability.note_inactive(existing[1], existing[0], existing[2])
+        revocation.mark_disabled(existing[0], existing[1], versions[(existing[0], existing[1])])
+        auditlog.record('user_disable', actor=current_user.username, target=existing[0], system=existing[1], client_ip=client_ip(request), user_id=user_id)
     except HTTPException: raise
-    except Exception as e:
-        print(f"Error in disable_user: {e}")
+    except Exception:
+        logger.exception("Error in disable_user")
         raise HTTPException(status_code=500, detail="An internal server error occurred during user deletion.")
     finally:
         if cursor: await cursor.close()
@@ -238,30 +504,70 @@ async def signup_oos_user(
     conn = None
     cursor = None
     try:
+        hashed_password = await hash_password(password)
+
         conn = await get_db_connection()
         cursor = await conn.cursor()
-
-        await cursor.execute("SELECT 1 FROM Users WHERE Username = ? AND System = ? AND isDisabled = 0", (username, system))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Username is already taken")
-        await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND System = ? AND isDisabled = 0", (email, system))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email is already is used")
-
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        await cursor.execute('''
-            INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (hashed_password, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix))
-        await conn.commit()
-    except HTTPException:
+        email_detail, username_detail = "Email is already is used", "Username is already taken"
+        try:
+            await cursor.execute(
+                _insert_user_unless(conn, "System = ? AND (Username = ? OR Email = ?)"),
+                (hashed_password, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix,
+                 system, username, email)
+            )
+        except Exception as e:
+            detail = await _conflict_detail(conn, cursor, e, email, email_detail, username_detail, system)
+            if detail is None:
+                raise
+            raise HTTPException(status_code=400, detail=detail)
+        if cursor.rowcount != 1:
+            raise HTTPException(status_code=400, detail=await _conflict_detail(conn, cursor, None, email, email_detail, username_detail, system))
+        invalidate_principal(username)
+        availability.note_active(system, username, email)
+        revocation.mark_enabled(username, system)
+    except (HTTPException, HashingBusyError):
         raise
-    except Exception as e:
-        print(f"Error in signup_oos_user: {e}")
+    except Exception:
+        logger.exception("Error in signup_oos_user")
         raise HTTPException(status_code=500, detail="An internal server error occurred during signup.")
     finally:
         if cursor: await cursor.close()
         if conn: await conn.close()
 
-    return {'message': 'OOS user account created successfully!'}
\ No newline at end of file
+    return {'message': 'OOS user account created successfully!'}
+
+# is a username and/or email free for a new account in a system? public and
+# limited per client ip; answered from the in-memory index where it can be
+# (see availability.py). signup still has the final word
+@router.get('/availability')
+async def check_availability(
+    request: Request,
+    response: Response,
+    username: Optional[str] = Query(None, max_length=255),
+    email: Optional[str] = Query(None, max_length=255),
+    system: str = Query('OOS'),
+):
+    if system not in VALID_SYSTEMS:
+        raise HTTPException(status_code=400, detail="Invalid system")
+    checks = [(kind, value) for kind, value in (('username', username), ('email', email)) if value and value.strip()]
+    if not checks:
+        raise HTTPException(status_code=400, detail="Give username and/or email")
+    retry_after = throttle.check_ip(client_ip(request))
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please try again later.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+    result = {'system': system}
+    try:
+        for kind, value in checks:
+            result[kind] = {'value': value, 'available': not await availability.is_taken(system, kind, value)}
+    except Exception:
+        logger.exception("Error in check_availability")
+        raise HTTPException(status_code=500, detail="An internal server error occurred while checking availability.")
+
+    # answers change with every signup
+    response.headers['Cache-Control'] = 'no-store'
+    return result
@@ -0,0 +1,173 @@
+# versioned schema migrations
+#
+# migrations/<backend>/NNNN_name.sql are applied in order, each in its own
+# transaction, and recorded in schemaMigrations. statements in a file are
+# separated by lines containing only GO. run from one process at a time:
+#
+#   python schema.py status
+#   python schema.py upgrade [target version]
+#   python schema.py plans      # query plans for the hot lookups; exits 1 on a full scan
+#
+# DB_MIGRATE_ON_STARTUP=true upgrades when the service starts.
+import asyncio
+import os
+import re
+import sys
+from datetime import datetime
+from dotenv import load_dotenv
+import applog
+import database
+from database import transaction
+
+load_dotenv()
+
+logger = applog.get_logger("schema")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+_VERSION_TABLE = {
+    "odbc": """
+        IF OBJECT_ID(N'dbo.schemaMigrations', N'U') IS NULL
+        CREATE TABLE dbo.schemaMigrations (Version INT NOT NULL PRIMARY KEY, Name NVARCHAR(200) NOT NULL, AppliedAt DATETIME2 NOT NULL)
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schemaMigrations (Version INTEGER NOT NULL PRIMARY KEY, Name TEXT NOT NULL, AppliedAt TIMESTAMP NOT NULL)
+    """,
+}
+
+_FILE_NAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+_GO = re.compile(r"^\s*GO\s*$", re.M | re.I)
+
+# the per-request lookups with sample parameters, built from the statements
+# the modules actually run so the plan check can't drift from them
+def hot_queries(backend):
+    import refresh_tokens
+    import reset_tokens
+    from routers import audit, auth, users
+
+    list_columns = ['UserID', 'Username', 'Email', 'UserRole', 'System']
+    list_filters = dict(system=None, role=None, disabled=None, name=None, email=None)
+    return {
+        "principal": (auth.USERS_BY_USERNAME_SQL, ("bench_user_0",)),
+        "login": (auth.USERS_BY_USERNAME_SQL + auth.SYSTEM_SCOPE_SQL, ("bench_user_0", "IMS")),
+        "forgot_password": (auth.FORGOT_PASSWORD_SQL, ("someone@example.com",)),
+        "reset_password": (reset_tokens.CHECK_SQL, ("someone@example.com", "0" * 64)),
+        "reset_sweep": (
+            backend.delete_limit_sql("tokensReset", reset_tokens.SWEEP_WHERE, reset_tokens.RESET_SWEEP_BATCH_SIZE),
+            (datetime(2000, 1, 1),),
+        ),
+        "refresh_rotate": (refresh_tokens.ROTATE_SQL, ("0" * 64,)),
+        "refresh_revoke_user": (refresh_tokens.REVOKE_USER_SQL, (datetime(2000, 1, 1), "bench_user_0", "IMS")),
+        # createdAt sorts by UserID as well (SORT_COLUMNS)
+        "list_users_by_id": users._list_users_query(
+            list_columns, users.SORT_COLUMNS['userID'], False, (None, 0), **list_filters
+        ),
+        "list_users_by_username": users._list_users_query(
+            list_columns, users.SORT_COLUMNS['username'], False, ("bench_user_0", 0), **list_filters
+        ),
+        "audit_by_target": audit.events_query({'Target': "bench_user_0"}),
+    }
+
+
+def _backend(backend=None):
+    return backend or database.BACKENDS[database.DB_BACKEND]()
+
+# [(version, name, path)] shipped for this backend
+def migrations_for(backend_name: str):
+    folder = os.path.join(MIGRATIONS_DIR, backend_name)
+    found = []
+    for file_name in os.listdir(folder):
+        match = _FILE_NAME.match(file_name)
+        if match:
+            found.append((int(match.group(1)), match.group(2), os.path.join(folder, file_name)))
+    return sorted(found)
+
+def _statements(path: str):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    for batch in _GO.split(text):
+        code = "\n".join(line for line in batch.splitlines() if not line.strip().startswith("--")).strip()
+        if code:
+            yield code
+
+async def _applied(conn, backend):
+    cursor = await conn.cursor()
+    try:
+        await cursor.execute(_VERSION_TABLE[backend.name])
+        await cursor.execute("SELECT Version FROM schemaMigrations")
+        return {row[0] for row in await cursor.fetchall()}
+    finally:
+        await cursor.close()
+
+# [(version, name, applied)]
+async def status(backend=None):
+    backend = _backend(backend)
+    conn = await backend.connect()
+    try:
+        applied = await _applied(conn, backend)
+    finally:
+        await conn.close()
+    return [(version, name, version in applied) for version, name, _ in migrations_for(backend.name)]
+
+# apply pending migrations up to target (default: all); returns the versions applied
+async def upgrade(backend=None, target: int | None = None):
+    backend = _backend(backend)
+    conn = await backend.connect()
+    done = []
+    try:
+        applied = await _applied(conn, backend)
+        for version, name, path in migrations_for(backend.name):
+            if version in applied or (target is not None and version > target):
+                continue
+            async with transaction(conn) as cursor:
+                for statement in _statements(path):
+                    await cursor.execute(statement)
+                await cursor.execute(
+                    "INSERT INTO schemaMigrations (Version, Name, AppliedAt) VALUES (?, ?, ?)",
+                    (version, name, datetime.utcnow())
+                )
+            logger.info("Applied migration", extra={"version": version, "migration": name})
+            done.append(version)
+    finally:
+        await conn.close()
+    return done
+
+# {query name: {"plan": [...], "full_scans": [...]}}
+async def query_plans(backend=None):
+    backend = _backend(backend)
+    conn = await backend.connect()
+    report = {}
+    try:
+        cursor = await conn.cursor()
+        try:
+            for name, (sql, params) in hot_queries(backend).items():
+                plan = await backend.explain(cursor, sql, params)
+                report[name] = {"plan": plan, "full_scans": [line for line in plan if backend.is_full_scan(line)]}
+        finally:
+            await cursor.close()
+    finally:
+        await conn.close()
+    return report
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "status":
+        for version, name, applied in asyncio.run(status()):
+            print(f"{version:04d} {name} {'applied' if applied else 'pending'}")
+    elif command == "upgrade":
+        target = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        done = asyncio.run(upgrade(target=target))
+        print(f"Applied: {', '.join(f'{v:04d}' for v in done)}" if done else "Schema is up to date.")
+    elif command == "plans":
+        report = asyncio.run(query_plans())
+        for name, result in report.items():
+            print(f"{name}: {'FULL SCAN' if result['full_scans'] else 'ok'}")
+            for line in result["plan"]:
+                print(f"    {line.strip()}")
+        if any(result["full_scans"] for result in report.values()):
+            sys.exit(1)
+    else:
+        print("usage: python schema.py [status|upgrade [version]|plans]")
+        sys.exit(1)
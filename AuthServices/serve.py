@@ -0,0 +1,90 @@
+# production launcher
+#
+# runs SERVE_WORKERS uvicorn worker processes sharing one listening socket,
+# with optional TLS:
+#
+#   python serve.py --workers 4 --port 4000
+#   python serve.py --tls                      # cert.pem / key.pem next to this file
+#   python serve.py --certfile /etc/auth/cert.pem --keyfile /etc/auth/key.pem
+#
+# work that must happen once, not once per worker, runs here before the
+# workers start: signing key generation and, with DB_MIGRATE_ON_STARTUP,
+# schema migrations. workers find each other through INVALIDATION_DIR (a
+# fresh temp directory unless set) to keep their caches coherent, and only
+# accept connections once warmed up. signals to the launcher:
+#
+#   HUP          restart workers one at a time (graceful, e.g. after a deploy)
+#   TTIN / TTOU  add / remove a worker
+#   TERM / INT   drain and stop
+import argparse
+import asyncio
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", 4000))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", os.cpu_count() or 1))
+SERVE_TLS_CERTFILE = os.getenv("SERVE_TLS_CERTFILE")
+SERVE_TLS_KEYFILE = os.getenv("SERVE_TLS_KEYFILE")
+# seconds a stopping worker gets to finish in-flight requests
+SERVE_GRACEFUL_SECONDS = int(os.getenv("SERVE_GRACEFUL_SECONDS", 30))
+
+
+def _prepare():
+    import refresh_tokens
+    import schema
+    import signing
+
+    # every worker must sign, and hash refresh tokens, with the same keys;
+    # generate them once here
+    signing.load_keys()
+    refresh_tokens.ensure_hmac_key()
+    if schema.DB_MIGRATE_ON_STARTUP:
+        done = asyncio.run(schema.upgrade())
+        print(f"Applied migrations: {', '.join(f'{v:04d}' for v in done)}" if done else "Schema is up to date.")
+    os.environ["DB_MIGRATE_ON_STARTUP"] = "false"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the auth service with several worker processes.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--tls", action="store_true", help="serve https with cert.pem/key.pem from the service directory")
+    parser.add_argument("--certfile", default=SERVE_TLS_CERTFILE)
+    parser.add_argument("--keyfile", default=SERVE_TLS_KEYFILE)
+    parser.add_argument("--graceful-timeout", type=int, default=SERVE_GRACEFUL_SECONDS)
+    args = parser.parse_args()
+
+    if args.tls:
+        args.certfile = args.certfile or os.path.join(SERVICE_DIR, "cert.pem")
+        args.keyfile = args.keyfile or os.path.join(SERVICE_DIR, "key.pem")
+    if bool(args.certfile) != bool(args.keyfile):
+        parser.error("--certfile and --keyfile go together")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    _prepare()
+    os.environ.setdefault("INVALIDATION_DIR", tempfile.mkdtemp(prefix="auth-invalidation-"))
+    if args.workers > 1:
+        os.environ.setdefault("STARTUP_WAIT_READY", "true")
+
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        app_dir=SERVICE_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        ssl_certfile=args.certfile,
+        ssl_keyfile=args.keyfile,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
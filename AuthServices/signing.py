@@ -0,0 +1,144 @@
+# asymmetric token signing with rotating keys
+#
+# private keys live in JWT_KEYS_DIR as <kid>.pem. the newest file (or
+# JWT_ACTIVE_KID) signs new tokens, every key in the directory still
+# verifies, so a rotation is: add a key, wait out ACCESS_TOKEN_EXPIRE_MINUTES
+# plus the jwks cache age, then delete the old file.
+#
+#   python signing.py rotate     # generate a new active key
+#   python signing.py list       # show kids, newest first
+import os
+import sys
+import uuid
+from datetime import datetime
+from dotenv import load_dotenv
+from jose import JWTError, jwk, jwt
+
+load_dotenv()
+
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "RS256")
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "keys"))
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", 300))
+
+# tokens signed with the old shared secret, for the switch-over only: off
+# unless JWT_ACCEPT_LEGACY_HS256 is set, and then it needs SECRET_KEY and
+# JWT_LEGACY_HS256_CUTOFF (unix time of the switch-over). a legacy token is
+# accepted only if it was issued before the cutoff and expires no later than
+# ACCESS_TOKEN_EXPIRE_MINUTES after it
+ACCEPT_LEGACY_HS256 = os.getenv("JWT_ACCEPT_LEGACY_HS256", "false").lower() in ("1", "true", "yes")
+LEGACY_HS256_SECRET = os.getenv("SECRET_KEY")
+LEGACY_HS256_CUTOFF = os.getenv("JWT_LEGACY_HS256_CUTOFF")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+
+_private_keys: dict = {}
+_public_keys: dict = {}
+_active_kid: str | None = None
+
+
+def _generate_pem():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if JWT_ALGORITHM.startswith("ES"):
+        curves = {"ES256": ec.SECP256R1(), "ES384": ec.SECP384R1(), "ES512": ec.SECP521R1()}
+        key = ec.generate_private_key(curves[JWT_ALGORITHM])
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+def _key_files():
+    if not os.path.isdir(JWT_KEYS_DIR):
+        return []
+    files = [f for f in os.listdir(JWT_KEYS_DIR) if f.endswith(".pem")]
+    files.sort(key=lambda f: os.path.getmtime(os.path.join(JWT_KEYS_DIR, f)), reverse=True)
+    return files
+
+# write a new private key; it becomes active on the next load_keys()
+def rotate_key():
+    os.makedirs(JWT_KEYS_DIR, exist_ok=True)
+    kid = f"{datetime.utcnow():%Y%m%d}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(JWT_KEYS_DIR, f"{kid}.pem")
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(_generate_pem())
+    return kid
+
+def load_keys():
+    global _private_keys, _public_keys, _active_kid
+    if ACCEPT_LEGACY_HS256 and not (LEGACY_HS256_SECRET and LEGACY_HS256_CUTOFF):
+        raise RuntimeError("JWT_ACCEPT_LEGACY_HS256 needs SECRET_KEY and JWT_LEGACY_HS256_CUTOFF")
+    files = _key_files()
+    if not files:
+        rotate_key()
+        files = _key_files()
+
+    private_keys, public_keys = {}, {}
+    for name in files:
+        kid = name[:-len(".pem")]
+        with open(os.path.join(JWT_KEYS_DIR, name)) as f:
+            key = jwk.construct(f.read(), JWT_ALGORITHM)
+        private_keys[kid] = key
+        public_keys[kid] = key.public_key()
+
+    active = JWT_ACTIVE_KID or files[0][:-len(".pem")]
+    if active not in private_keys:
+        raise RuntimeError(f"Active signing key '{active}' not found in {JWT_KEYS_DIR}")
+    _private_keys, _public_keys, _active_kid = private_keys, public_keys, active
+
+def _ensure_loaded():
+    if _active_kid is None:
+        load_keys()
+
+def encode_token(claims: dict):
+    _ensure_loaded()
+    return jwt.encode(claims, _private_keys[_active_kid], algorithm=JWT_ALGORITHM, headers={"kid": _active_kid})
+
+def _decode_legacy(token: str):
+    payload = jwt.decode(token, LEGACY_HS256_SECRET, algorithms=["HS256"])
+    cutoff = float(LEGACY_HS256_CUTOFF)
+    # the old tokens carry no iat, so exp is what bounds them
+    if "iat" in payload and payload["iat"] >= cutoff:
+        raise JWTError("Legacy token issued after the cutoff")
+    if payload.get("exp", float("inf")) > cutoff + ACCESS_TOKEN_EXPIRE_MINUTES * 60:
+        raise JWTError("Legacy token outlives the cutoff")
+    return payload
+
+# verify signature and expiry; raises JWTError
+def decode_token(token: str):
+    _ensure_loaded()
+    header = jwt.get_unverified_header(token)
+    kid = header.get("kid")
+    if kid is None:
+        if ACCEPT_LEGACY_HS256 and header.get("alg") == "HS256":
+            return _decode_legacy(token)
+        raise JWTError("Missing key id")
+    key = _public_keys.get(kid)
+    if key is None:
+        raise JWTError("Unknown key id")
+    return jwt.decode(token, key, algorithms=[JWT_ALGORITHM])
+
+def jwks():
+    _ensure_loaded()
+    keys = []
+    for kid, key in _public_keys.items():
+        entry = key.to_dict()
+        entry.update({"kid": kid, "use": "sig", "alg": JWT_ALGORITHM})
+        keys.append(entry)
+    return {"keys": keys}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "rotate":
+        print(f"New signing key: {rotate_key()}")
+    elif command == "list":
+        for name in _key_files():
+            print(name[:-len(".pem")])
+    else:
+        print("usage: python signing.py [rotate|list]")
+        sys.exit(1)
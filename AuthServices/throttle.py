@@ -0,0 +1,153 @@
+# login throttling — token buckets plus exponential lockout after repeated
+# failures, checked before any db or bcrypt work. state is per process and
+# bounded: least recently seen keys are evicted past max_entries.
+import os
+import time
+from collections import OrderedDict
+import metrics
+
+
+class _Entry:
+    __slots__ = ('tokens', 'updated', 'failures', 'locked_until', 'last_failure')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.failures = 0
+        self.locked_until = 0.0
+        self.last_failure = 0.0
+
+
+class Throttle:
+    def __init__(
+        self,
+        name: str,
+        rate_per_minute: float,
+        burst: int,
+        max_failures: int,
+        lockout_base: float,
+        lockout_max: float,
+        max_entries: int = 100000,
+        failure_window: float | None = None,
+    ):
+        self.name = name
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_failures = max_failures
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.max_entries = max_entries
+        # failures older than this are forgotten; None keeps them until success()
+        self.failure_window = failure_window
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(self.burst, now)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+            entry.tokens = min(self.burst, entry.tokens + (now - entry.updated) * self.rate)
+            entry.updated = now
+        return entry
+
+    # seconds until key may try again; 0 when allowed
+    def retry_after(self, key: str):
+        now = time.monotonic()
+        entry = self._entry(key, now)
+        if entry.locked_until > now:
+            return entry.locked_until - now
+        if entry.tokens < 1:
+            return (1 - entry.tokens) / self.rate
+        return 0.0
+
+    def consume(self, key: str):
+        entry = self._entry(key, time.monotonic())
+        entry.tokens -= 1
+
+    def failure(self, key: str):
+        now = time.monotonic()
+        entry = self._entry(key, now)
+        if self.failure_window is not None and now - entry.last_failure > self.failure_window:
+            entry.failures = 0
+        entry.failures += 1
+        entry.last_failure = now
+        if entry.failures >= self.max_failures:
+            lockout = min(self.lockout_max, self.lockout_base * 2 ** (entry.failures - self.max_failures))
+            entry.locked_until = now + lockout
+            metrics.incr(f'{self.name}_lockouts')
+
+    def success(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.failures = 0
+            entry.locked_until = 0.0
+
+
+# per account: a handful of attempts, then 30s, 60s, 120s ... up to 15 min
+user_throttle = Throttle(
+    'login_user',
+    rate_per_minute=float(os.getenv('LOGIN_USER_RATE_PER_MINUTE', 10)),
+    burst=int(os.getenv('LOGIN_USER_BURST', 5)),
+    max_failures=int(os.getenv('LOGIN_USER_MAX_FAILURES', 5)),
+    lockout_base=float(os.getenv('LOGIN_LOCKOUT_BASE_SECONDS', 30)),
+    lockout_max=float(os.getenv('LOGIN_LOCKOUT_MAX_SECONDS', 900)),
+)
+
+# per client ip: looser, since a store's terminals can share one address.
+# a successful login doesn't clear it (one valid account in a sprayed list
+# would), the failure count lapses after a quiet window instead
+ip_throttle = Throttle(
+    'login_ip',
+    rate_per_minute=float(os.getenv('LOGIN_IP_RATE_PER_MINUTE', 60)),
+    burst=int(os.getenv('LOGIN_IP_BURST', 30)),
+    max_failures=int(os.getenv('LOGIN_IP_MAX_FAILURES', 50)),
+    lockout_base=float(os.getenv('LOGIN_LOCKOUT_BASE_SECONDS', 30)),
+    lockout_max=float(os.getenv('LOGIN_LOCKOUT_MAX_SECONDS', 900)),
+    failure_window=float(os.getenv('LOGIN_IP_FAILURE_WINDOW_SECONDS', 3600)),
+)
+
+# availability lookups, per client ip: enough for a signup form checking as
+# the user types, too few to walk a list of emails. nothing counts as a failure
+lookup_throttle = Throttle(
+    'lookup_ip',
+    rate_per_minute=float(os.getenv('AVAILABILITY_RATE_PER_MINUTE', 60)),
+    burst=int(os.getenv('AVAILABILITY_BURST', 20)),
+    max_failures=1,
+    lockout_base=0,
+    lockout_max=0,
+)
+
+# check both keys, consume from both only when both allow; returns retry-after seconds
+def check(subject: str, client_ip: str, scope: str = 'login'):
+    user_key, ip_key = f'{scope}:{subject.lower()}', f'{scope}:{client_ip}'
+    wait = max(user_throttle.retry_after(user_key), ip_throttle.retry_after(ip_key))
+    if wait > 0:
+        metrics.incr(f'{scope}_throttled')
+        return wait
+    user_throttle.consume(user_key)
+    ip_throttle.consume(ip_key)
+    return 0.0
+
+def record_failure(subject: str, client_ip: str, scope: str = 'login'):
+    user_throttle.failure(f'{scope}:{subject.lower()}')
+    ip_throttle.failure(f'{scope}:{client_ip}')
+
+# only the account's own count; the ip's lapses on its own
+def record_success(subject: str, client_ip: str, scope: str = 'login'):
+    user_throttle.success(f'{scope}:{subject.lower()}')
+
+# per-ip only check for anonymous lookups; returns retry-after seconds
+def check_ip(client_ip: str, scope: str = 'availability'):
+    key = f'{scope}:{client_ip}'
+    wait = lookup_throttle.retry_after(key)
+    if wait > 0:
+        metrics.incr(f'{scope}_throttled')
+        return wait
+    lookup_throttle.consume(key)
+    return 0.0
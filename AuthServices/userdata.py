@@ -0,0 +1,54 @@
+# version of the user data this process serves, for conditional GETs
+#
+# bump() is called after every write to Users made through the service (see
+# invalidate_principal in routers/auth.py), including writes announced by
+# other workers. an ETag is the version plus whatever else selects the
+# response, so an unchanged version means an unchanged response and a
+# matching If-None-Match can be answered 304 without touching the db.
+#
+# the version is per process and tagged with a random instance id: a client
+# that lands on another worker, or on a restarted one, gets a full response
+# instead of a wrong 304. writes made to the database behind the service's
+# back are not seen until the next bump.
+import hashlib
+import os
+import time
+from email.utils import formatdate
+import metrics
+
+_instance = os.urandom(4).hex()
+_version = 0
+_modified_at = time.time()
+
+
+def version():
+    return _version
+
+def bump():
+    global _version, _modified_at
+    _version += 1
+    _modified_at = time.time()
+    metrics.incr('user_data_version_bumps')
+    return _version
+
+# weak ETag for the current version and the given response selectors
+def etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+    return f'W/"{_instance}-{_version}-{digest}"'
+
+def headers(tag: str):
+    return {
+        "ETag": tag,
+        "Last-Modified": formatdate(_modified_at, usegmt=True),
+        # clients may keep the body but must revalidate before each use
+        "Cache-Control": "private, no-cache",
+    }
+
+def not_modified(if_none_match: str | None, tag: str):
+    if not if_none_match:
+        return False
+    candidates = {t.strip() for t in if_none_match.split(",")}
+    # weak comparison: W/"x" and "x" match
+    matched = "*" in candidates or tag in candidates or tag[2:] in candidates
+    metrics.incr('conditional_requests', labels={"result": "not_modified" if matched else "changed"})
+    return matched
@@ -60,13 +60,21 @@ function Usermanagement() {
       setLoading(true);
       setError(null);
       try {
-        const response = await fetch("http://127.0.0.1:4000/users/list-users", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        if (!response.ok) throw new Error(`Failed to fetch data: ${response.status}`);
-        let apiData = await response.json();
-        if (apiData && !Array.isArray(apiData)) apiData = [apiData];
-        else if (!apiData) apiData = [];
+        // list-users is paged; follow X-Next-Cursor until the last page
+        let apiData = [];
+        let cursor = null;
+        do {
+          const params = new URLSearchParams({ limit: "1000" });
+          if (cursor) params.set("cursor", cursor);
+          const response = await fetch(`http://127.0.0.1:4000/users/list-users?${params}`, {
+            headers: { Authorization: `Bearer ${token}` },
+          });
+          if (!response.ok) throw new Error(`Failed to fetch data: ${response.status}`);
+          const page = await response.json();
+          if (Array.isArray(page)) apiData = apiData.concat(page);
+          else if (page) apiData.push(page);
+          cursor = response.headers.get("X-Next-Cursor");
+        } while (cursor);
 
         const mappedEmployees = apiData.map((user) => ({
           id: user.userID,